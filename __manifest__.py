@@ -44,6 +44,7 @@
         # Data
         'data/sequences.xml',
         'data/energy_price_projection_data.xml',
+        'data/ir_cron_data.xml',
         
         # Views (ANTES QUE LOS MENÚS)
         'views/solar_quotation_views.xml',
@@ -51,13 +52,15 @@
         'views/solar_panel_product_views.xml',
         'views/auxiliary_views.xml',
         'views/res_partner_views.xml',
+        'views/recompute_job_views.xml',
         
         # Menús (AL FINAL)
         'views/menu_views.xml',
         
         # Wizards
         #'wizards/import_consumption_wizard.xml',
-        #'wizards/multi_meter_quotation_wizard.xml',
+        'wizards/import_meter_consumption_wizard.xml',
+        'wizards/multi_meter_quotation_wizard.xml',
     ],
     'demo': [
         'demo/demo_data.xml',
@@ -73,6 +76,6 @@
     'application': True,
     'auto_install': False,
     'external_dependencies': {
-        'python': ['xlrd', 'openpyxl'],
+        'python': ['xlrd', 'openpyxl', 'numpy'],
     },
 }
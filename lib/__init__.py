@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+# Plain Python helpers shared by the models and wizards (no ORM imports).
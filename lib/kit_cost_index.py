@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Sorted capacity -> cost per kW index for solar kit pricing."""
+
+import math
+
+from .quotation_engine import lookup_cost_per_kw
+
+
+class KitCostIndex:
+    """Immutable, sorted list of (capacity kW, cost per kW) points.
+
+    Lookups return the cost of the smallest capacity able to cover the
+    requested power, found by bisection.  With ``interpolate`` the cost is
+    linearly interpolated between the two capacities around the power.
+    Powers above the largest capacity get ``default``.
+    """
+
+    __slots__ = ('capacities', 'costs')
+
+    def __init__(self, points=()):
+        capacities, costs = [], []
+        for capacity, cost in sorted(points):
+            if capacities and capacities[-1] == capacity:
+                continue  # Keep the first cost found for a capacity
+            capacities.append(capacity)
+            costs.append(cost)
+        self.capacities = tuple(capacities)
+        self.costs = tuple(costs)
+
+    def __len__(self):
+        return len(self.capacities)
+
+    def __repr__(self):
+        return '<KitCostIndex %s>' % list(zip(self.capacities, self.costs))
+
+    def lookup(self, power_kw, interpolate=False, default=None):
+        """Cost per kW of one power, as ``quotation_engine.lookup_cost_per_kw`` finds it"""
+        cost = lookup_cost_per_kw(
+            [power_kw], self.capacities, self.costs, default=math.nan, interpolate=interpolate)[0]
+        return default if math.isnan(cost) else float(cost)
+
+    def changed_ranges(self, other, interpolate=False):
+        """Power ranges where lookups in ``self`` and ``other`` may differ
+
+        Returns a list of ``(low, high)`` intervals, open on the left and
+        closed on the right; ``low`` is None below the first capacity and
+        ``high`` is None above the last one.
+        """
+        breakpoints = sorted(set(self.capacities) | set(other.capacities))
+        ranges = []
+        previous = None
+        for capacity in breakpoints:
+            changed = self.lookup(capacity, interpolate) != other.lookup(capacity, interpolate)
+            if interpolate and previous is not None:
+                changed = changed or (
+                    self.lookup(previous, interpolate) != other.lookup(previous, interpolate))
+            if changed:
+                if ranges and ranges[-1][1] == previous:
+                    ranges[-1] = (ranges[-1][0], capacity)
+                else:
+                    ranges.append((previous, capacity))
+            previous = capacity
+        return ranges
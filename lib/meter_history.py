@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""Parsing of meter billing history files into consumption values.
+
+The functions only take and return plain, picklable values so that whole
+files can be parsed in import worker processes.  Rejected rows are
+reported as ``(row number, error kind, value)`` tuples, the caller turns
+the kinds into translated messages.
+"""
+
+import io
+from contextlib import closing
+from itertools import islice
+
+from . import spreadsheet_reader
+from .month_parser import parse_month_column
+
+PARSE_BATCH_SIZE = 10000
+
+# Files of an archive read as bill files, their format being detected
+FILE_EXTENSIONS = ('.csv', '.txt', '.xlsx', '.xls')
+
+
+class RowError(ValueError):
+
+    def __init__(self, kind, value):
+        super().__init__(kind, value)
+        self.kind = kind
+        self.value = value
+
+
+def _cell(row, column):
+    """Value of a 1-based column, None when unmapped or missing"""
+    if column <= 0 or column > len(row):
+        return None
+    return row[column - 1]
+
+
+def _float(row, column):
+    value = _cell(row, column)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise RowError('value', value)
+
+
+def _parse_row(row, month_year, columns, default_year):
+    supply_number = _cell(row, columns['supply_number'])
+    if isinstance(supply_number, float) and supply_number.is_integer():
+        supply_number = int(supply_number)
+
+    if month_year is None:
+        raise RowError('month', _cell(row, columns['month']))
+    month, year = month_year
+
+    if columns['year']:
+        value = _cell(row, columns['year'])
+        try:
+            year = int(value)
+        except (TypeError, ValueError):
+            raise RowError('year', value)
+    elif not year:
+        year = default_year
+    if not 1900 <= year <= 2100:
+        raise RowError('year', year)
+
+    try:
+        energy_kwh = _float(row, columns['consumption'])
+    except RowError as e:
+        raise RowError('consumption', e.value)
+    if energy_kwh is None:
+        raise RowError('consumption', '')
+    if energy_kwh < 0:
+        raise RowError('negative', energy_kwh)
+
+    return {
+        'supply_number': str(supply_number).strip() if supply_number is not None else False,
+        'year': year,
+        'month': month,
+        'energy_kwh': energy_kwh,
+        'energy_cost': _float(row, columns['cost']),
+        'max_demand_kw': _float(row, columns['demand']),
+        'peak_hours_kwh': _float(row, columns['peak']),
+        'off_peak_hours_kwh': _float(row, columns['off_peak']),
+    }
+
+
+def parse_rows(rows, options):
+    """Map typed (row number, row) pairs to consumption values
+
+    ``options`` holds ``columns`` (1-based column of each value, 0 when
+    absent), ``has_header`` and ``default_year``.  The month column is
+    parsed a batch at a time.
+
+    :return: ([(row number, values)], [(row number, error kind, value)])
+    """
+    columns = options['columns']
+    data_rows = (
+        (row_idx, row) for row_idx, row in rows
+        if not (row_idx == 1 and options['has_header'])
+        and any(cell is not None for cell in row)  # Skip empty rows
+    )
+    parsed = []
+    errors = []
+    while True:
+        batch = list(islice(data_rows, PARSE_BATCH_SIZE))
+        if not batch:
+            break
+        months = parse_month_column([_cell(row, columns['month']) for row_idx, row in batch])
+        for (row_idx, row), month_year in zip(batch, months):
+            try:
+                parsed.append((row_idx, _parse_row(row, month_year, columns, options['default_year'])))
+            except RowError as e:
+                errors.append((row_idx, e.kind, e.value))
+    return parsed, errors
+
+
+def read_file(stream, options):
+    """Detect the format of a file stream and parse its rows
+
+    Bill layouts knowing their column names map the columns from the
+    header row, over the configured ones.
+
+    :return: (parsed rows, errors) as returned by ``parse_rows``
+    """
+    import_format = spreadsheet_reader.detect_format(stream)
+    if import_format.column_names and options['has_header']:
+        with closing(import_format.read(stream)) as rows:
+            header = next(rows, ())
+        stream.seek(0)
+        options = dict(options, columns=dict(options['columns'], **import_format.map_columns(header)))
+
+    # Supply numbers stay text so leading zeros survive text files
+    column = options['columns']['supply_number']
+    rows = import_format.read(stream, text_columns=(column - 1,) if column else ())
+    with closing(rows):
+        return parse_rows(enumerate(rows, 1), options)
+
+
+def parse_file(task):
+    """Parse one file given as (name, content, options)
+
+    Entry point of the import worker processes: a file that cannot be
+    read is reported as a row 0 error instead of failing the import.
+
+    :return: (name, parsed rows, errors)
+    """
+    name, content, options = task
+    try:
+        parsed, errors = read_file(io.BytesIO(content), options)
+    except Exception as e:
+        return name, [], [(0, 'file', str(e) or e.__class__.__name__)]
+    return name, parsed, errors
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""Month values found in utility bills and spreadsheets, as selection keys.
+
+Cells are matched against a token table built once at import time: exact
+English and Spanish month names and abbreviations, and month numbers.
+Cells carrying a year as well (dates, ``2024-03``, ``03/2024``,
+``marzo 2024``, ``Mar-24``, ``202403``) yield it alongside the month.
+Numbers read as text from spreadsheets (``'3.0'``) are months too.
+``parse_month_column`` parses a whole column and resolves every distinct
+cell value only once, which is what makes long exports cheap: a utility
+file repeats the same few dozen month values over millions of rows.
+"""
+
+import re
+from datetime import date
+
+MONTH_KEYS = tuple(str(month) for month in range(1, 13))
+
+_MONTH_NAMES = (
+    # English, English abbreviation, Spanish, Spanish abbreviation
+    ('january', 'jan', 'enero', 'ene'),
+    ('february', 'feb', 'febrero', 'feb'),
+    ('march', 'mar', 'marzo', 'mar'),
+    ('april', 'apr', 'abril', 'abr'),
+    ('may', 'may', 'mayo', 'may'),
+    ('june', 'jun', 'junio', 'jun'),
+    ('july', 'jul', 'julio', 'jul'),
+    ('august', 'aug', 'agosto', 'ago'),
+    ('september', 'sep', 'septiembre', 'sep'),
+    ('october', 'oct', 'octubre', 'oct'),
+    ('november', 'nov', 'noviembre', 'nov'),
+    ('december', 'dec', 'diciembre', 'dic'),
+)
+
+
+def _build_token_table():
+    table = {}
+    for key, names in zip(MONTH_KEYS, _MONTH_NAMES):
+        for name in names:
+            table[name] = key
+        table[key] = key
+        table[key.zfill(2)] = key
+    table['sept'] = table['setiembre'] = table['set'] = '9'
+    return table
+
+
+MONTH_TOKENS = _build_token_table()
+
+# Separated forms, the year being told apart by its four digits
+_YEAR_FIRST = re.compile(r'(\d{4})[-/.\s]+(\w+?)\.?(?:[-/.\s]+\d{1,2})?(?:[\sT].*)?$')
+_YEAR_LAST = re.compile(r'(?:\d{1,2}[-/.\s]+)?(\w+?)\.?[-/.\s,]+(?:de(?:l)?\s+)?(\d{4})$')
+_COMPACT = re.compile(r'(\d{4})(\d{2})$')
+# Month name and two-digit year, as spreadsheets format ``mmm-yy`` dates
+_SHORT_YEAR = re.compile(r'([^\W\d_]+)\.?[-/.\s]+(\d{2})$')
+# Whole numbers written with a decimal part
+_DECIMAL = re.compile(r'(\d+)\.0+$')
+
+
+def _from_number(value):
+    try:
+        if value != int(value):
+            return None
+    except (ValueError, OverflowError):  # NaN, infinity
+        return None
+    value = int(value)
+    if 1 <= value <= 12:
+        return str(value), None
+    if 190001 <= value <= 210012 and 1 <= value % 100 <= 12:
+        return str(value % 100), value // 100  # YYYYMM
+    return None
+
+
+def _from_text(value):
+    token = value.strip().lower().rstrip('.')
+    month = MONTH_TOKENS.get(token)
+    if month:
+        return month, None
+    match = _YEAR_FIRST.match(token)
+    if match and match.group(2) in MONTH_TOKENS:
+        return MONTH_TOKENS[match.group(2)], int(match.group(1))
+    match = _YEAR_LAST.match(token)
+    if match and match.group(1) in MONTH_TOKENS:
+        return MONTH_TOKENS[match.group(1)], int(match.group(2))
+    match = _SHORT_YEAR.match(token)
+    if match and match.group(1) in MONTH_TOKENS:
+        return MONTH_TOKENS[match.group(1)], 2000 + int(match.group(2))
+    match = _COMPACT.match(token) or _DECIMAL.match(token)
+    if match:
+        return _from_number(int(token.split('.')[0]))
+    return None
+
+
+def parse_month_year(value):
+    """Return (month key, year or None) of a cell, or None if not a month"""
+    if isinstance(value, date):
+        return str(value.month), value.year
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return _from_number(value)
+    if isinstance(value, str):
+        return _from_text(value)
+    return None
+
+
+def parse_month_column(values):
+    """Parse a column of cells, each distinct value being parsed once
+
+    :return: list of (month key, year or None) tuples, None for the cells
+        that are not months
+    """
+    parsed = {}
+    result = []
+    for value in values:
+        # Keyed by type too, True and 1.0 must not share the entry of 1
+        key = (value.__class__, value)
+        try:
+            month_year = parsed[key]
+        except KeyError:
+            month_year = parsed[key] = parse_month_year(value)
+        except TypeError:  # Unhashable cell
+            month_year = parse_month_year(value)
+        result.append(month_year)
+    return result
+
+
+def parse_month(month_value):
+    """Return the '1'..'12' month key of a number, name or date value"""
+    month_year = parse_month_year(month_value)
+    if month_year is None:
+        raise ValueError(f"Invalid month value: {month_value}")
+    return month_year[0]
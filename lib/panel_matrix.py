@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""Panel catalog as a feature matrix, scored for many powers at once."""
+
+import numpy as np
+
+from .solar_kernel import TECH_BONUS
+
+
+def panels_needed(required_powers_kw, power_wp):
+    """Panels of ``power_wp`` needed for each required power, rounded up
+
+    Panels without power give 0.
+    """
+    required = np.asarray(required_powers_kw, dtype=np.float64)
+    power_wp = np.asarray(power_wp, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(power_wp > 0, np.ceil(required * 1000.0 / power_wp), 0.0)
+
+
+class PanelMatrix:
+    """Immutable columns of panel features, in catalog order
+
+    A panel scores higher with its efficiency, with a smaller total area
+    and a lower cost per kW, when preferred and for newer technologies.
+    Scores have one row per required power and one column per panel.
+    Ties keep the catalog order.
+    """
+
+    __slots__ = ('ids', 'power_wp', 'area_m2', 'unit_cost', 'base_score')
+
+    def __init__(self, panels=()):
+        panels = tuple(panels)
+        self.ids = np.array([panel.id for panel in panels], dtype=np.int64)
+        self.power_wp = np.array([panel.power_wp for panel in panels], dtype=np.float64)
+        self.area_m2 = np.array([panel.area_m2 or 0.0 for panel in panels], dtype=np.float64)
+        self.unit_cost = np.array([panel.unit_cost or 0.0 for panel in panels], dtype=np.float64)
+        # Terms not depending on the required power
+        self.base_score = np.array([
+            panel.efficiency * 2 + (50 if panel.is_preferred else 0) + TECH_BONUS.get(panel.technology, 0)
+            for panel in panels
+        ], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __repr__(self):
+        return '<PanelMatrix %d panels>' % len(self)
+
+    def score(self, required_powers_kw):
+        """Scores, panels needed, actual power (kW) and area of each power and panel
+
+        :return: dict of (powers, panels) arrays
+        """
+        required = np.asarray(required_powers_kw, dtype=np.float64).reshape(-1, 1)
+        quantity = panels_needed(required, self.power_wp[np.newaxis, :])
+        actual_power_kw = quantity * self.power_wp / 1000.0
+        total_area = quantity * self.area_m2
+        total_cost = quantity * self.unit_cost
+        with np.errstate(divide='ignore', invalid='ignore'):
+            score = self.base_score + np.where(total_area > 0, 1000.0 / total_area, 0.0)
+            score += np.where(
+                (total_cost > 0) & (actual_power_kw > 0), 10000.0 * actual_power_kw / total_cost, 0.0)
+
+        return {
+            'score': score,
+            'panels_needed': quantity.astype(np.int64),
+            'actual_power_kw': actual_power_kw,
+            'total_area_m2': total_area,
+        }
+
+    def top(self, required_powers_kw, limit=1):
+        """Best ``limit`` panels of each power, best first
+
+        :return: one list per power of ``(panel id, score, panels needed,
+            actual power kW, total area m²)`` tuples
+        """
+        if not len(self):
+            return [[] for _power in np.atleast_1d(required_powers_kw)]
+        results = self.score(required_powers_kw)
+        ranks = self._top_columns(results['score'], min(limit, len(self)))
+        rows = np.arange(len(ranks))[:, np.newaxis]
+        columns = [
+            self.ids[ranks],
+            results['score'][rows, ranks],
+            results['panels_needed'][rows, ranks],
+            results['actual_power_kw'][rows, ranks],
+            results['total_area_m2'][rows, ranks],
+        ]
+        return [list(zip(*(column[row].tolist() for column in columns))) for row in range(len(ranks))]
+
+    @staticmethod
+    def _top_columns(scores, limit):
+        """Columns of the ``limit`` best scores of each row, best first
+
+        Rows are partitioned rather than sorted.  Among the scores equal to
+        the last one selected, the first columns are taken, then the
+        selection is sorted stably: ties keep the catalog order.
+        """
+        threshold = -np.partition(-scores, limit - 1, axis=1)[:, limit - 1:limit]
+        above = scores > threshold
+        tied = scores == threshold
+        missing = limit - above.sum(axis=1, keepdims=True)
+        selected = above | (tied & (np.cumsum(tied, axis=1) <= missing))
+        columns = np.nonzero(selected)[1].reshape(len(scores), limit)
+        order = np.argsort(-np.take_along_axis(scores, columns, axis=1), axis=1, kind='stable')
+        return np.take_along_axis(columns, order, axis=1)
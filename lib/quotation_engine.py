@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""Vectorized quotation calculations.
+
+Every function takes NumPy arrays holding one value per quotation and
+returns a dict of arrays with the same length.  No ORM access happens
+here: the model collects the inputs of a whole recordset once, runs the
+three stages and assigns the results back.  These are the only copy of
+the sizing, production and financial formulas: single what-if systems go
+through ``calculate_batch`` too.
+"""
+
+import numpy as np
+
+from .solar_kernel import DEFAULT_COST_PER_KW, QuotationResult
+
+
+# Bisection steps of the IRR search, enough for the precision of a float
+IRR_ITERATIONS = 60
+IRR_BOUNDS = (-0.99, 10.0)
+
+CASH_FLOW_FIELDS = (
+    'net_present_value', 'internal_rate_of_return', 'levelized_cost_of_energy', 'discounted_payback_years',
+)
+
+
+def _as_float(values):
+    return np.asarray(values, dtype=np.float64)
+
+
+def size_systems(consumption, radiation, efficiency, panel_power_wp, panel_area_m2):
+    """Required power, panel quantity, actual power and panel area."""
+    consumption = _as_float(consumption)
+    radiation = _as_float(radiation)
+    efficiency_factor = _as_float(efficiency) / 100.0
+    panel_power_wp = _as_float(panel_power_wp)
+    panel_area_m2 = _as_float(panel_area_m2)
+
+    valid = (consumption != 0) & (radiation > 0) & (efficiency_factor != 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        system_power_kw = np.where(valid, consumption / (radiation * efficiency_factor), 0.0)
+
+        has_panel = valid & (panel_power_wp > 0)
+        panel_quantity = np.where(
+            has_panel,
+            np.floor(system_power_kw * 1000.0 / panel_power_wp) + 1,  # Round up
+            0,
+        ).astype(np.int64)
+
+    actual_system_power_kw = np.where(
+        has_panel, panel_quantity * panel_power_wp / 1000.0, system_power_kw)
+    total_panel_area_m2 = np.where(has_panel, panel_quantity * panel_area_m2, 0.0)
+
+    return {
+        'system_power_kw': system_power_kw,
+        'panel_quantity': panel_quantity,
+        'actual_system_power_kw': actual_system_power_kw,
+        'total_panel_area_m2': total_panel_area_m2,
+    }
+
+
+def estimate_production(actual_system_power_kw, radiation, efficiency, consumption):
+    """Annual production and the share of consumption it covers."""
+    actual_system_power_kw = _as_float(actual_system_power_kw)
+    radiation = _as_float(radiation)
+    efficiency_factor = _as_float(efficiency) / 100.0
+    consumption = _as_float(consumption)
+
+    production = np.where(
+        actual_system_power_kw != 0,
+        actual_system_power_kw * radiation * efficiency_factor,
+        0.0,
+    )
+    with np.errstate(divide='ignore', invalid='ignore'):
+        coverage = np.where(
+            consumption > 0,
+            np.minimum(production / consumption * 100.0, 100.0),
+            0.0,
+        )
+
+    return {
+        'estimated_annual_production': production,
+        'coverage_percentage': coverage,
+    }
+
+
+def monthly_balance(annual_production, radiation_profile, consumption):
+    """Month by month production against consumption.
+
+    ``radiation_profile`` and ``consumption`` are (quotations, 12) matrices,
+    January first.  The annual production is spread over the months in
+    proportion to their radiation, so the months add up to it.  Energy
+    produced in a month only offsets the consumption of that month.
+    """
+    annual_production = _as_float(annual_production)
+    radiation_profile = _as_float(radiation_profile).reshape(-1, 12)
+    consumption = _as_float(consumption).reshape(-1, 12)
+
+    annual_radiation = radiation_profile.sum(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        production = np.where(
+            annual_radiation > 0,
+            annual_production[:, np.newaxis] * radiation_profile / annual_radiation,
+            0.0,
+        )
+        self_consumption = np.minimum(production, consumption)
+        coverage = np.where(consumption > 0, self_consumption / consumption * 100.0, 0.0)
+
+    return {
+        'production': production,
+        'consumption': consumption,
+        'self_consumption': self_consumption,
+        'surplus': production - self_consumption,
+        'deficit': consumption - self_consumption,
+        'coverage': coverage,
+    }
+
+
+def lookup_cost_per_kw(actual_system_power_kw, capacities, costs, default=DEFAULT_COST_PER_KW,
+                       interpolate=False):
+    """Cost per kW of the smallest kit capacity >= the system power.
+
+    ``capacities`` must be sorted ascending and ``costs`` aligned with it
+    (see ``KitCostIndex``).  With ``interpolate`` the cost is linear between
+    the surrounding capacities.  Systems larger than every capacity get
+    ``default``.
+    """
+    actual_system_power_kw = _as_float(actual_system_power_kw)
+    capacities = _as_float(capacities)
+    costs = _as_float(costs)
+    if not len(capacities):
+        return np.full(actual_system_power_kw.shape, default)
+
+    positions = np.searchsorted(capacities, actual_system_power_kw, side='left')
+    covered = positions < len(capacities)
+    if interpolate:
+        found = np.interp(actual_system_power_kw, capacities, costs)
+    else:
+        found = costs[np.minimum(positions, len(capacities) - 1)]
+    return np.where(covered, found, default)
+
+
+def compute_financials(actual_system_power_kw, production, tax_rate, cost_per_kw, energy_price):
+    """Investment, taxes, monthly savings and simple payback period.
+
+    ``energy_price`` is a scalar; ``None`` means there is no projection
+    for the current year, in which case no savings are estimated.
+    """
+    actual_system_power_kw = _as_float(actual_system_power_kw)
+    production = _as_float(production)
+    tax_rate = _as_float(tax_rate)
+    cost_per_kw = _as_float(cost_per_kw)
+
+    has_power = actual_system_power_kw != 0
+    subtotal = np.where(has_power, actual_system_power_kw * cost_per_kw, 0.0)
+    tax_amount = subtotal * (tax_rate / 100.0)
+    total = subtotal + tax_amount
+
+    if energy_price is None:
+        monthly_savings = np.zeros_like(production)
+    else:
+        monthly_savings = np.where(
+            has_power & (production != 0), production * energy_price / 12.0, 0.0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        payback = np.where(monthly_savings > 0, total / (monthly_savings * 12.0), 0.0)
+
+    return {
+        'subtotal_investment': subtotal,
+        'tax_amount': tax_amount,
+        'total_investment': total,
+        'monthly_savings': monthly_savings,
+        'payback_period_years': payback,
+    }
+
+
+def simulate_cash_flows(total_investment, production, horizon_years, energy_prices, assumptions):
+    """Yearly cash flows over each horizon, with their NPV, IRR, LCOE and discounted payback.
+
+    Matrices are (quotations, years): year 0 is the investment, year 1 the
+    current one.  ``energy_prices`` holds the price of each year from the
+    current one and must cover the longest horizon.  Production degrades
+    every year, operation and maintenance costs escalate and the inverter
+    is replaced once within the horizon.  IRR and payback are 0 when the
+    investment is never recovered; rates are in %.
+    """
+    investment = _as_float(total_investment)
+    production = _as_float(production)
+    horizon = np.asarray(horizon_years, dtype=np.int64)
+    years = np.arange(1, horizon.max(initial=0) + 1)
+    if not len(years):
+        return {name: np.zeros_like(investment) for name in CASH_FLOW_FIELDS}
+    in_horizon = years <= horizon[:, np.newaxis]
+    prices = _as_float(energy_prices)[:len(years)]
+
+    yearly_production = np.where(
+        in_horizon,
+        production[:, np.newaxis] * (1 - assumptions.degradation_rate / 100.0) ** (years - 1),
+        0.0,
+    )
+    costs = (
+        investment[:, np.newaxis] * assumptions.om_cost_rate / 100.0
+        * (1 + assumptions.om_escalation_rate / 100.0) ** (years - 1)
+    )
+    replaces_inverter = (years == assumptions.inverter_replacement_year) & (years < horizon[:, np.newaxis])
+    costs = np.where(in_horizon, costs, 0.0) + np.where(
+        replaces_inverter, investment[:, np.newaxis] * assumptions.inverter_cost_rate / 100.0, 0.0)
+    cash_flows = yearly_production * prices - costs
+
+    discount = (1 + assumptions.discount_rate / 100.0) ** -years
+    discounted = cash_flows * discount
+    npv = discounted.sum(axis=1) - investment
+
+    discounted_production = (yearly_production * discount).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lcoe = np.where(
+            discounted_production > 0,
+            (investment + (costs * discount).sum(axis=1)) / discounted_production,
+            0.0,
+        )
+
+        # Interpolated within the year the cumulated cash flow turns positive
+        cumulative = np.cumsum(discounted, axis=1) - investment[:, np.newaxis]
+        recovered = (cumulative >= 0) & in_horizon
+        has_payback = recovered.any(axis=1) & (investment > 0)
+        first = recovered.argmax(axis=1)
+        rows = np.arange(len(investment))
+        before = np.where(first > 0, cumulative[rows, first - 1], -investment)
+        step = discounted[rows, first]
+        payback = np.where(has_payback & (step > 0), first - before / step, 0.0)
+
+    return {
+        'net_present_value': npv,
+        'internal_rate_of_return': _internal_rate_of_return(investment, cash_flows) * 100.0,
+        'levelized_cost_of_energy': lcoe,
+        'discounted_payback_years': payback,
+    }
+
+
+def _internal_rate_of_return(investment, cash_flows):
+    """Rate zeroing the NPV of each row, by bisection on all rows at once"""
+    exponents = np.arange(1, cash_flows.shape[1] + 1)
+
+    def npv_at(rate):
+        return (cash_flows / (1 + rate[:, np.newaxis]) ** exponents).sum(axis=1) - investment
+
+    low = np.full(investment.shape, IRR_BOUNDS[0])
+    high = np.full(investment.shape, IRR_BOUNDS[1])
+    low_positive = npv_at(low) > 0
+    defined = (investment > 0) & low_positive & (npv_at(high) <= 0)
+    for _iteration in range(IRR_ITERATIONS):
+        middle = (low + high) / 2
+        below_root = (npv_at(middle) > 0) == low_positive
+        low = np.where(below_root, middle, low)
+        high = np.where(below_root, high, middle)
+    return np.where(defined, (low + high) / 2, 0.0)
+
+
+def calculate_batch(inputs, cost_index=None, energy_price=None, interpolate=False):
+    """Sizing, production and financials of systems that are not records
+
+    Takes a sequence of ``QuotationInput`` and returns one
+    ``QuotationResult`` per input, in the same order.  ``cost_index`` is a
+    ``KitCostIndex``; without it, or when a system is larger than every
+    kit capacity, ``DEFAULT_COST_PER_KW`` applies.
+    """
+    consumption = [item.annual_consumption_kwh for item in inputs]
+    radiation = [item.annual_radiation for item in inputs]
+    efficiency = [item.system_efficiency for item in inputs]
+
+    results = size_systems(
+        consumption, radiation, efficiency,
+        [item.panel_power_wp for item in inputs],
+        [item.panel_area_m2 for item in inputs],
+    )
+    actual_power = results['actual_system_power_kw']
+    results.update(estimate_production(actual_power, radiation, efficiency, consumption))
+    capacities = cost_index.capacities if cost_index is not None else ()
+    costs = cost_index.costs if cost_index is not None else ()
+    results.update(compute_financials(
+        actual_power,
+        results['estimated_annual_production'],
+        [item.tax_rate for item in inputs],
+        lookup_cost_per_kw(actual_power, capacities, costs, interpolate=interpolate),
+        energy_price,
+    ))
+
+    names = list(results)
+    columns = [results[name].tolist() for name in names]
+    return [QuotationResult(**dict(zip(names, row))) for row in zip(*columns)]
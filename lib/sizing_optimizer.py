@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""Search of the system sizes trading off cost, coverage and roof area.
+
+A size is a panel model, a panel quantity and the solar kit capacity tier
+it is priced with.  The whole space is evaluated at once with NumPy after
+pruning what cannot be on the Pareto front:
+
+* panels of the same power only differ by their area: the smallest one
+  is kept for each power;
+* a size is priced with the cheapest tier able to hold it, any other tier
+  costing more for the same coverage and area;
+* sizes of the same power have the same cost and coverage: only the
+  smallest one is kept for each power;
+* quantities stop at the first one covering the whole consumption, more
+  panels only adding cost and area, and at the roof area and budget.
+
+Cost and coverage then only depend on the system power.  Within a pricing
+tier the cost grows with the power, so the sizes that could dominate a
+given one form a contiguous power range of each tier: dominance is tested
+with range minimum queries on the areas, without comparing sizes pairwise.
+
+Production follows the quotation formula (kW x annual radiation x
+efficiency), coverage being capped at 100 %.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from .solar_kernel import DEFAULT_COST_PER_KW
+
+# Relative tolerance of the power and cost comparisons
+TOLERANCE = 1e-9
+
+
+@dataclass(slots=True, frozen=True)
+class SizingOption:
+    """A Pareto optimal system size"""
+    panel_id: int
+    panel_quantity: int
+    kit_capacity_kw: float  # None above the largest kit capacity
+    system_power_kw: float
+    annual_production: float
+    coverage_percentage: float
+    total_panel_area_m2: float
+    total_investment: float
+
+
+class _RangeMinimum:
+    """Sparse table answering minimum queries over ranges of an array"""
+
+    __slots__ = ('table',)
+
+    def __init__(self, values):
+        table = [np.asarray(values, dtype=np.float64)]
+        width = 1
+        while 2 * width <= len(values):
+            previous = table[-1]
+            table.append(np.minimum(previous[:-width], previous[width:]))
+            width *= 2
+        self.table = table
+
+    def query(self, start, stop):
+        """Minimum of ``values[start:stop]`` for arrays of bounds, inf when empty"""
+        start = np.asarray(start, dtype=np.int64)
+        stop = np.asarray(stop, dtype=np.int64)
+        empty = stop <= start
+        length = np.where(empty, 1, stop - start)
+        level = np.floor(np.log2(length)).astype(np.int64)
+        result = np.full(start.shape, np.inf)
+        for index in np.unique(level[~empty]):
+            mask = ~empty & (level == index)
+            row = self.table[index]
+            result[mask] = np.minimum(row[start[mask]], row[stop[mask] - (1 << index)])
+        return result
+
+
+def _cheapest_tiers(capacities, costs):
+    """Cheapest cost per kW among the tiers from each one up, and its tier
+
+    The costs returned never decrease with the capacity.
+    """
+    costs = np.asarray(costs, dtype=np.float64)
+    best_cost = np.minimum.accumulate(costs[::-1])[::-1]
+    best_tier = np.arange(len(costs))
+    for position in range(len(costs) - 2, -1, -1):
+        if best_cost[position + 1] < costs[position]:
+            best_tier[position] = best_tier[position + 1]
+    return np.asarray(capacities, dtype=np.float64), best_cost, best_tier
+
+
+def optimize_sizing(panels, annual_consumption_kwh, annual_radiation, cost_index,
+                    system_efficiency=85.0, tax_rate=0.0, max_area_m2=None,
+                    min_coverage=0.0, max_budget=None):
+    """Pareto front of cost, coverage and area among the possible sizes
+
+    ``panels`` are ``PanelSpec`` and ``cost_index`` a ``KitCostIndex``.
+    Sizes must fit ``max_area_m2``, reach ``min_coverage`` % and cost at
+    most ``max_budget`` (taxes included), each being ignored when None.
+
+    :return: ``SizingOption`` list, cheapest first
+    """
+    production_per_kw = annual_radiation * system_efficiency / 100.0
+    smallest = {}
+    for panel in panels:
+        kept = smallest.get(panel.power_wp)
+        if panel.power_wp > 0 and (kept is None or panel.area_m2 < kept.area_m2):
+            smallest[panel.power_wp] = panel
+    catalog = list(smallest.values())
+    if annual_consumption_kwh <= 0 or production_per_kw <= 0 or not catalog:
+        return []
+    power_wp = np.array([panel.power_wp for panel in catalog], dtype=np.float64)
+    area = np.array([panel.area_m2 for panel in catalog], dtype=np.float64)
+
+    capacities, tier_costs, tier_index = _cheapest_tiers(cost_index.capacities, cost_index.costs)
+    segment_costs = np.append(tier_costs, DEFAULT_COST_PER_KW) * (1 + tax_rate / 100.0)
+    required_kw = annual_consumption_kwh / production_per_kw
+
+    # Quantity range of each panel
+    first = np.maximum(np.ceil(required_kw * min_coverage / 100.0 * 1000.0 / power_wp - TOLERANCE), 1)
+    last = np.ceil(required_kw * 1000.0 / power_wp - TOLERANCE)
+    if len(capacities) and DEFAULT_COST_PER_KW < tier_costs[-1]:
+        # Going over the largest capacity lowers the cost per kW
+        last = np.maximum(last, np.floor(capacities[-1] * 1000.0 / power_wp) + 1)
+    if max_area_m2 is not None:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            last = np.minimum(last, np.where(area > 0, np.floor(max_area_m2 / area + TOLERANCE), last))
+    if max_budget is not None:
+        last = np.minimum(last, np.floor(max_budget / segment_costs.min() * 1000.0 / power_wp + TOLERANCE))
+    counts = np.maximum(last - first + 1, 0).astype(np.int64)
+    total = int(counts.sum())
+    if not total:
+        return []
+
+    # One candidate per (panel, quantity)
+    panel_index = np.repeat(np.arange(len(catalog)), counts)
+    quantity = (first[panel_index] + np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts))
+    system_kw = quantity * power_wp[panel_index] / 1000.0
+    total_area = quantity * area[panel_index]
+
+    # Smallest candidate of each power, the first panel of the catalog on a tie
+    order = np.lexsort((np.arange(total), total_area, system_kw))
+    levels = np.flatnonzero(np.diff(system_kw[order], prepend=-np.inf) > 0)
+    best = order[levels]
+    system_kw, total_area = system_kw[best], total_area[best]
+
+    segment = np.searchsorted(capacities, system_kw * (1 - TOLERANCE), side='left')
+    investment = system_kw * segment_costs[segment]
+    coverage = np.where(
+        system_kw >= required_kw * (1 - TOLERANCE), 100.0,
+        system_kw * production_per_kw / annual_consumption_kwh * 100.0)
+    feasible = coverage >= min_coverage - TOLERANCE
+    if max_budget is not None:
+        feasible &= investment <= max_budget * (1 + TOLERANCE)
+    best, system_kw, total_area = best[feasible], system_kw[feasible], total_area[feasible]
+    segment, investment, coverage = segment[feasible], investment[feasible], coverage[feasible]
+
+    # A size is dominated by one at least as cheap, covering as much, and
+    # smaller: in each segment, those lie between the power giving the same
+    # coverage and the power giving the same cost.
+    positions = np.arange(len(system_kw))
+    lowest_kw = np.where(coverage >= 100.0, required_kw, system_kw)
+    lowest = np.searchsorted(system_kw, lowest_kw * (1 - TOLERANCE), side='left')
+    areas = _RangeMinimum(total_area)
+    dominated = np.zeros(len(system_kw), dtype=bool)
+    for segment_id in np.unique(segment):
+        members = np.flatnonzero(segment == segment_id)
+        start, stop = members[0], members[-1] + 1
+        highest = np.searchsorted(
+            system_kw, investment / segment_costs[segment_id] * (1 + TOLERANCE), side='right')
+        low = np.clip(lowest, start, stop)
+        high = np.clip(highest, start, stop)
+        # Sizes of lower power dominate on an equal area, higher ones with a smaller area
+        below = areas.query(low, np.minimum(high, positions))
+        above = areas.query(np.maximum(low, positions + 1), high)
+        dominated |= (below <= total_area) | (above < total_area)
+
+    front = np.flatnonzero(~dominated)
+    front = front[np.lexsort((total_area[front], -coverage[front], investment[front]))]
+    kit_capacity = np.append(capacities[tier_index], np.nan)[segment]
+
+    return [
+        SizingOption(
+            panel_id=catalog[panel_index[best[index]]].id,
+            panel_quantity=int(quantity[best[index]]),
+            kit_capacity_kw=None if np.isnan(kit_capacity[index]) else float(kit_capacity[index]),
+            system_power_kw=float(system_kw[index]),
+            annual_production=float(system_kw[index] * production_per_kw),
+            coverage_percentage=float(coverage[index]),
+            total_panel_area_m2=float(total_area[index]),
+            total_investment=float(investment[index]),
+        )
+        for index in front
+    ]
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Inputs, results and constants of the solar calculations, free of any ORM dependency.
+
+The formulas themselves live in one place each: sizing, production and
+financials in ``quotation_engine``, which the quotation computes and
+what-if simulations both run, and panel scoring in ``panel_matrix``.
+Inputs and outputs are slotted dataclasses so simulations, APIs and
+benchmarks can run them without creating records.
+"""
+
+from dataclasses import asdict, dataclass
+
+# Cost used when no solar kit capacity covers the system power (USD/kW)
+DEFAULT_COST_PER_KW = 1200.0
+
+# Score bonus given to newer panel technologies
+TECH_BONUS = {
+    'hjt': 30, 'topcon': 25, 'perc': 20, 'bifacial': 15,
+    'mono': 10, 'poly': 5, 'thin_film': 0
+}
+
+
+@dataclass(slots=True, frozen=True)
+class PanelSpec:
+    """Scoring inputs of a catalog panel"""
+    id: int
+    power_wp: float
+    efficiency: float
+    area_m2: float
+    unit_cost: float = 0.0
+    technology: str = 'mono'
+    is_preferred: bool = False
+    application: str = 'all'
+
+
+@dataclass(slots=True, frozen=True)
+class QuotationInput:
+    """Everything needed to size and price one system"""
+    annual_consumption_kwh: float
+    annual_radiation: float
+    system_efficiency: float = 85.0
+    panel_power_wp: float = 0.0
+    panel_area_m2: float = 0.0
+    tax_rate: float = 12.0
+
+
+@dataclass(slots=True)
+class QuotationResult:
+    """Stored figures of a quotation, named after the model fields"""
+    system_power_kw: float = 0.0
+    panel_quantity: int = 0
+    actual_system_power_kw: float = 0.0
+    total_panel_area_m2: float = 0.0
+    estimated_annual_production: float = 0.0
+    coverage_percentage: float = 0.0
+    subtotal_investment: float = 0.0
+    tax_amount: float = 0.0
+    total_investment: float = 0.0
+    monthly_savings: float = 0.0
+    payback_period_years: float = 0.0
+
+    def as_dict(self):
+        return asdict(self)
+
+
+@dataclass(slots=True, frozen=True)
+class CashFlowAssumptions:
+    """Economic assumptions of the multi-year cash flow simulation"""
+    discount_rate: float = 8.0  # % per year
+    degradation_rate: float = 0.5  # % of the production lost every year
+    om_cost_rate: float = 1.0  # Yearly operation and maintenance, % of the investment
+    om_escalation_rate: float = 3.0  # % per year
+    inverter_replacement_year: int = 12
+    inverter_cost_rate: float = 10.0  # % of the investment
+    horizon_years: int = 25  # When the panel has no warranty
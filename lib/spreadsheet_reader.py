@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""Streaming readers yielding typed rows from CSV and Excel files.
+
+Every reader is a generator over a binary file object: rows are produced
+one at a time so memory use does not grow with the file size, and callers
+that only need the first rows (previews) stop reading early.  Cells come
+out typed: ``None`` for empty cells, ``int``/``float`` for numbers,
+``datetime`` for Excel dates and stripped ``str`` otherwise.  Text columns
+listed in ``text_columns`` (0-based) stay text, e.g. codes with leading
+zeros.
+
+Readers are registered as ``ImportFormat`` entries, detected from the
+first bytes of the file rather than by trying parsers in turn.  Parser
+libraries (openpyxl, xlrd) are only imported when a file needs them.
+"""
+
+import codecs
+import csv
+import importlib
+import io
+import re
+import unicodedata
+import zipfile
+
+_NUMBER = re.compile(r'[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$')
+
+# Bytes read from the start of a file to detect its format
+HEAD_SIZE = 4096
+
+ZIP_MAGIC = b'PK\x03\x04'
+OLE2_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+
+
+def _require(module_name, extension):
+    try:
+        return importlib.import_module(module_name)
+    except ImportError:
+        raise ImportError("%s is required to read %s files" % (module_name, extension))
+
+
+def _type_text(value, decimal_comma=False):
+    """Type a text cell the way a spreadsheet would"""
+    value = value.strip()
+    if not value:
+        return None
+    if decimal_comma:
+        # Dots group thousands: 1.234,5 -> 1234.5
+        number = value.replace('.', '').replace(',', '.')
+        if _NUMBER.match(number):
+            value = number
+    if not _NUMBER.match(value):
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def _type_cell(value):
+    if isinstance(value, str):
+        return _type_text(value)
+    return value
+
+
+def _decode_as_latin1(error):
+    """Decode the bytes that are not UTF-8 as Latin-1, as legacy exports write them"""
+    return error.object[error.start:error.end].decode('latin-1'), error.end
+
+
+# Error handler of the UTF-8 decoding: only the head of a file is checked,
+# a Latin-1 byte further down must not fail the import halfway
+codecs.register_error('sparks_latin1_fallback', _decode_as_latin1)
+
+
+def _detect_encoding(head):
+    """UTF-8 when the head decodes as such, Latin-1 (never fails) otherwise"""
+    try:
+        # A multi-byte character may be cut at the end of a partial head
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=len(head) < HEAD_SIZE)
+    except UnicodeDecodeError:
+        return 'latin-1'
+    return 'utf-8-sig'
+
+
+def iter_csv_rows(stream, encoding='utf-8-sig', delimiter=',', text_columns=(), decimal_comma=False):
+    """Yield typed rows of a CSV stream, decoding it incrementally
+
+    Bytes that are not valid in ``encoding`` are read as Latin-1.
+    """
+    text = io.TextIOWrapper(stream, encoding=encoding, errors='sparks_latin1_fallback', newline='')
+    try:
+        for row in csv.reader(text, delimiter=delimiter):
+            yield tuple(
+                (cell.strip() or None) if idx in text_columns else _type_text(cell, decimal_comma)
+                for idx, cell in enumerate(row)
+            )
+    finally:
+        text.detach()  # Leave the caller's stream open
+
+
+def iter_xlsx_rows(stream, **options):
+    """Yield typed rows of the first sheet of an .xlsx stream
+
+    The workbook is opened read-only, which parses the sheet XML lazily
+    and skips styles, instead of building the whole workbook in memory.
+    """
+    openpyxl = _require('openpyxl', '.xlsx')
+    workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield tuple(_type_cell(cell) for cell in row)
+    finally:
+        workbook.close()
+
+
+def iter_xls_rows(stream, **options):
+    """Yield typed rows of the first sheet of a legacy .xls stream
+
+    xlrd needs the file contents, but with ``on_demand`` only the first
+    sheet is parsed and its cells are converted row by row.
+    """
+    xlrd = _require('xlrd', '.xls')
+    workbook = xlrd.open_workbook(file_contents=stream.read(), on_demand=True)
+    try:
+        sheet = workbook.sheet_by_index(0)
+        for row_idx in range(sheet.nrows):
+            yield tuple(_xls_cell_value(xlrd, cell, workbook.datemode) for cell in sheet.row(row_idx))
+    finally:
+        workbook.release_resources()
+
+
+def _xls_cell_value(xlrd, cell, datemode):
+    if cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK):
+        return None
+    if cell.ctype == xlrd.XL_CELL_NUMBER:
+        value = cell.value
+        return int(value) if value.is_integer() else value
+    if cell.ctype == xlrd.XL_CELL_DATE:
+        return xlrd.xldate_as_datetime(cell.value, datemode)
+    if cell.ctype == xlrd.XL_CELL_BOOLEAN:
+        return bool(cell.value)
+    if cell.ctype == xlrd.XL_CELL_TEXT:
+        return _type_text(cell.value)
+    return None  # Error cells
+
+
+def iter_text_rows(stream, text_columns=(), **options):
+    """Yield typed rows of a CSV stream in UTF-8 or Latin-1"""
+    head = _read_head(stream)
+    return iter_csv_rows(stream, encoding=_detect_encoding(head), text_columns=text_columns)
+
+
+def iter_cnel_rows(stream, text_columns=(), **options):
+    """Yield typed rows of a CNEL bill export
+
+    Exports are comma separated, or semicolon separated with decimal
+    commas as written by spreadsheets in Spanish locales.
+    """
+    head = _read_head(stream)
+    semicolon = ';' in _first_line(head)
+    return iter_csv_rows(stream, encoding=_detect_encoding(head), delimiter=';' if semicolon else ',',
+                         text_columns=text_columns, decimal_comma=semicolon)
+
+
+def _read_head(stream):
+    head = stream.read(HEAD_SIZE)
+    stream.seek(0)
+    return head
+
+
+def _first_line(head):
+    return head.decode(_detect_encoding(head), errors='replace').split('\n', 1)[0]
+
+
+def _normalize(value):
+    """Lowercase ASCII form of a header cell, for column name matching"""
+    value = unicodedata.normalize('NFKD', str(value or '')).encode('ascii', 'ignore').decode()
+    return ' '.join(value.lower().replace('.', ' ').split())
+
+
+def _detect_xlsx(stream, head):
+    if not head.startswith(ZIP_MAGIC):
+        return False
+    try:
+        with zipfile.ZipFile(stream) as archive:
+            return 'xl/workbook.xml' in archive.namelist()
+    except zipfile.BadZipFile:
+        return False
+    finally:
+        stream.seek(0)
+
+
+def _detect_xls(stream, head):
+    return head.startswith(OLE2_MAGIC)
+
+
+def _detect_text(stream, head):
+    # Binary formats have NUL bytes in their first block, text has none
+    return b'\x00' not in head and not head.startswith(ZIP_MAGIC)
+
+
+def _detect_cnel(stream, head):
+    """CNEL exports name the CUEN supply code in their header"""
+    if not _detect_text(stream, head):
+        return False
+    header = _normalize(_first_line(head)).replace(';', ' ').replace(',', ' ')
+    return 'cuen' in header.split()
+
+
+class ImportFormat:
+    """A file format readable as typed rows
+
+    ``detect(stream, head)`` tells from the first bytes whether a file is
+    in this format and ``reader(stream, text_columns=...)`` yields its
+    rows.  Utility bill layouts also give ``column_names``, the header
+    names of the column of each imported value, so their columns are
+    found without configuration.
+    """
+
+    __slots__ = ('name', 'label', 'detect', 'reader', 'column_names')
+
+    def __init__(self, name, label, detect, reader, column_names=None):
+        self.name = name
+        self.label = label
+        self.detect = detect
+        self.reader = reader
+        self.column_names = column_names or {}
+
+    def read(self, stream, text_columns=()):
+        return self.reader(stream, text_columns=text_columns)
+
+    def map_columns(self, header):
+        """1-based column of each value named in the ``header`` row"""
+        positions = {_normalize(cell): idx for idx, cell in enumerate(header, 1) if cell is not None}
+        columns = {}
+        for value_name, names in self.column_names.items():
+            for name in names:
+                if name in positions:
+                    columns[value_name] = positions[name]
+                    break
+        return columns
+
+
+# Registered formats, in detection order
+FORMATS = []
+
+
+def register_format(import_format, before=None):
+    """Add a format, detected before the format named ``before`` if any"""
+    names = [fmt.name for fmt in FORMATS]
+    FORMATS.insert(names.index(before) if before in names else len(FORMATS), import_format)
+
+
+def get_format(name):
+    return next((fmt for fmt in FORMATS if fmt.name == name), None)
+
+
+def detect_format(stream):
+    """Registered format of a seekable binary stream, from its first bytes"""
+    head = _read_head(stream)
+    for import_format in FORMATS:
+        if import_format.detect(stream, head):
+            return import_format
+    raise ValueError("Unsupported file format")
+
+
+register_format(ImportFormat('xlsx', 'Excel Workbook (.xlsx)', _detect_xlsx, iter_xlsx_rows))
+register_format(ImportFormat('xls', 'Excel 97-2003 Workbook (.xls)', _detect_xls, iter_xls_rows))
+register_format(ImportFormat(
+    'cnel', 'CNEL Bill Export', _detect_cnel, iter_cnel_rows,
+    column_names={
+        'supply_number': ('cuen', 'codigo unico', 'suministro'),
+        'year': ('anio', 'ano', 'year'),
+        'month': ('mes', 'periodo', 'fecha emision', 'fecha'),
+        'consumption': ('consumo kwh', 'consumo', 'energia kwh', 'kwh'),
+        'cost': ('valor total', 'total factura', 'valor', 'total'),
+        'demand': ('demanda kw', 'demanda maxima', 'demanda'),
+        'peak': ('consumo punta', 'punta kwh'),
+        'off_peak': ('consumo fuera de punta', 'fuera de punta kwh', 'base kwh'),
+    },
+))
+register_format(ImportFormat('csv', 'CSV File (.csv)', _detect_text, iter_text_rows))
+
+
+def iter_rows(stream, file_type=None, text_columns=()):
+    """Yield typed rows of a seekable binary ``stream``
+
+    ``file_type`` names a registered format; by default, or when it is not
+    one, the format is detected from the content.
+    """
+    import_format = get_format(file_type) or detect_format(stream)
+    return import_format.read(stream, text_columns=text_columns)
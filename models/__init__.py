@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
+from . import mixins
 from . import consumption_line
 from . import auxiliary_models
 from . import energy_meter
 from . import solar_panel_product
 from . import solar_quotation
 from . import res_partner
+from . import recompute_job
@@ -2,10 +2,14 @@
 
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
+from odoo.tools import frozendict, ormcache
+
+from ..lib.kit_cost_index import KitCostIndex
 
 
 class EnergyProjection(models.Model):
     _name = 'sparks.energy.projection'
+    _inherit = ['sparks.pricing.propagation.mixin']
     _description = 'Energy Price Projection by Year'
     _order = 'name desc'
 
@@ -49,9 +53,59 @@ class EnergyProjection(models.Model):
             except ValueError:
                 raise ValidationError(_("Year must be a valid number (e.g., 2024)"))
 
+    def _register_hook(self):
+        super()._register_hook()
+        # Warm the master data caches when the registry is loaded by a worker
+        self._get_price_table()
+        self.env['sparks.solar.radiation']._get_radiation_table()
+        self.env['sparks.solar.radiation']._get_monthly_radiation_table()
+        self.env['sparks.solar.panel.product']._get_panel_catalog(self.env.company.id)
+
+    @ormcache()
+    def _get_price_table(self):
+        """Cached (year, actual price, projected price, inflation %) rows"""
+        projections = self.sudo().search_read(
+            [], ['name', 'actual_price', 'projected_price', 'inflation_rate'])
+        return tuple(
+            (row['name'], row['actual_price'], row['projected_price'], row['inflation_rate'])
+            for row in projections
+        )
+
+    @api.model
+    def _get_projected_price(self, year):
+        """Projected price for ``year``, None when there is no projection"""
+        year = str(year)
+        for name, _actual, projected, _inflation in self._get_price_table():
+            if name == year:
+                return projected
+        return None
+
+    @api.model
+    def _get_price_path(self, start_year, years):
+        """Projected price of each of ``years`` years from ``start_year``
+
+        Years after the last projection grow from it at its inflation rate,
+        years before the first projection have no price (0).
+        """
+        projections = sorted(
+            (int(name), projected, inflation or 0.0)
+            for name, _actual, projected, inflation in self._get_price_table()
+            if name and name.isdigit()
+        )
+        prices = []
+        for year in range(start_year, start_year + years):
+            known = [projection for projection in projections if projection[0] <= year]
+            if not known:
+                prices.append(0.0)
+                continue
+            projection_year, price, inflation = known[-1]
+            prices.append(price * (1 + inflation / 100.0) ** (year - projection_year))
+        return prices
+
 
 class SolarRadiation(models.Model):
     _name = 'sparks.solar.radiation'
+    _inherit = ['sparks.cache.invalidation.mixin']
     _description = 'Solar Radiation Data by Location'
     _rec_name = 'display_name'
 
@@ -167,14 +221,57 @@ class SolarRadiation(models.Model):
             ('10', 'October'), ('11', 'November'), ('12', 'December')
         ]
         
-        for month_num, month_name in month_data:
-            self.env['sparks.solar.radiation.month'].create({
-                'radiation_id': self.id,
-                'month': month_num,
-                'radiation': 4.5,  # Default value
-            })
+        self.env['sparks.solar.radiation.month'].create([{
+            'radiation_id': self.id,
+            'month': month_num,
+            'radiation': 4.5,  # Default value
+        } for month_num, month_name in month_data])
     # Agregar este método en la clase SolarRadiation (después del método _create_monthly_lines)
 
+    @ormcache()
+    def _get_radiation_table(self):
+        """Cached {radiation id: (total radiation, adjusted total radiation)}"""
+        records = self.sudo().search_read([], ['total_radiation', 'total_radiation_adjusted'])
+        return frozendict(
+            (row['id'], (row['total_radiation'], row['total_radiation_adjusted']))
+            for row in records
+        )
+
+    @api.model
+    def _get_annual_radiation(self, radiation_id):
+        """Adjusted annual radiation of a record, its raw total as fallback"""
+        total, adjusted = self._get_radiation_table().get(radiation_id, (0.0, 0.0))
+        return adjusted or total
+
+    @ormcache()
+    def _get_monthly_radiation_table(self):
+        """Cached {radiation id: 12 monthly radiation totals, January first}"""
+        lines = self.env['sparks.solar.radiation.month'].sudo().search_fetch(
+            [], ['radiation_id', 'month', 'monthly_total'])
+        table = {}
+        for line in lines:
+            months = table.setdefault(line.radiation_id.id, [0.0] * 12)
+            months[int(line.month) - 1] = line.monthly_total
+        return frozendict((radiation_id, tuple(months)) for radiation_id, months in table.items())
+
+    @api.model
+    def _get_monthly_radiation(self, radiation_id):
+        """Monthly radiation totals of a record, zeros when it has none"""
+        return self._get_monthly_radiation_table().get(radiation_id, (0.0,) * 12)
+
+    def action_recompute_quotations(self):
+        """Recompute the quotations of these locations in background"""
+        quotations = self.env['sparks.solar.quotation'].search([('city_id', 'in', self.ids)])
+        job = self.env['sparks.recompute.job']._enqueue(
+            quotations, name=_("Radiation update: %s") % ", ".join(self.mapped('city')))
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': 'sparks.recompute.job',
+            'res_id': job.id,
+            'view_mode': 'form',
+            'target': 'current',
+        }
+
     @api.model
     def _get_state_by_code(self, country_code, state_code):
         """Helper method to get state by country and state code"""
@@ -195,8 +292,14 @@ class SolarRadiation(models.Model):
 
 class SolarRadiationMonth(models.Model):
     _name = 'sparks.solar.radiation.month'
+    _inherit = ['sparks.cache.invalidation.mixin', 'sparks.unique.key.mixin']
     _description = 'Monthly Solar Radiation Data'
     _order = 'month'
+    _unique_key = ('radiation_id', 'month')
+    _sql_constraints = [
+        ('radiation_month_unique', 'unique(radiation_id, month)',
+         'Each month can only be defined once per radiation record.'),
+    ]
 
     radiation_id = fields.Many2one(
         'sparks.solar.radiation', 
@@ -252,21 +355,14 @@ class SolarRadiationMonth(models.Model):
         for record in self:
             record.monthly_total = record.radiation_adjusted * record.days_in_month
 
-    @api.constrains('month', 'radiation_id')
-    def _check_unique_month(self):
-        for record in self:
-            existing = self.search([
-                ('radiation_id', '=', record.radiation_id.id),
-                ('month', '=', record.month),
-                ('id', '!=', record.id)
-            ])
-            if existing:
-                month_name = dict(self._fields['month'].selection)[record.month]
-                raise ValidationError(_("Month %s is already defined for this radiation record.") % month_name)
+    def _raise_duplicate_key(self, key, existing):
+        month_name = dict(self._fields['month'].selection)[key[1]]
+        raise ValidationError(_("Month %s is already defined for this radiation record.") % month_name)
 
 
 class SolarKitPowerCapacity(models.Model):
     _name = 'sparks.solar.kit.capacity'
+    _inherit = ['sparks.pricing.propagation.mixin']
     _description = 'Solar Kit Power Capacity Options'
     _order = 'power'
 
@@ -298,6 +394,7 @@ class SolarKitPowerCapacity(models.Model):
 
 class SolarKitReferenceCost(models.Model):
     _name = 'sparks.solar.kit.reference'
+    _inherit = ['sparks.pricing.propagation.mixin']
     _description = 'Solar Kit Reference Cost by Year'
 
     name = fields.Char(
@@ -324,10 +421,54 @@ class SolarKitReferenceCost(models.Model):
     
     active = fields.Boolean(string='Active', default=True)
 
+    @api.model
+    def _get_cost_index(self, year=None):
+        """Capacity -> cost per kW index of the reference in force for a year"""
+        if year is None:
+            year = fields.Date.today().year
+        return self._get_cost_index_for_year(int(year))
+
+    @ormcache('year')
+    def _get_cost_index_for_year(self, year):
+        """Build the index of the active reference for ``year``
+
+        The reference of that exact year wins, then the most recent earlier
+        year, then the closest later one. Details whose power capacity is
+        archived are left out.
+        """
+        def reference_year(reference):
+            try:
+                return int(reference.year.name or 0)
+            except ValueError:
+                return 0
+
+        references = self.sudo().search([])
+        if not references:
+            return KitCostIndex()
+
+        def priority(reference):
+            ref_year = reference_year(reference)
+            if ref_year <= year:
+                return (True, ref_year, reference.id)
+            return (False, -ref_year, reference.id)
+
+        reference = max(references, key=priority)
+        return KitCostIndex(
+            (detail.power_capacity_id.power, detail.cost_per_kw)
+            for detail in reference.detail_line_ids
+            if detail.power_capacity_id.active
+        )
+
 
 class SolarKitDetail(models.Model):
     _name = 'sparks.solar.kit.detail'
+    _inherit = ['sparks.pricing.propagation.mixin', 'sparks.unique.key.mixin']
     _description = 'Solar Kit Cost Detail by Power Capacity'
+    _unique_key = ('reference_id', 'power_capacity_id')
+    _sql_constraints = [
+        ('reference_capacity_unique', 'unique(reference_id, power_capacity_id)',
+         'Each power capacity can only be defined once per reference cost.'),
+    ]
 
     reference_id = fields.Many2one(
         'sparks.solar.kit.reference', 
@@ -400,16 +541,9 @@ class SolarKitDetail(models.Model):
             else:
                 record.cost_per_kw = 0.0
 
-    @api.constrains('power_capacity_id', 'reference_id')
-    def _check_unique_capacity(self):
-        for record in self:
-            existing = self.search([
-                ('reference_id', '=', record.reference_id.id),
-                ('power_capacity_id', '=', record.power_capacity_id.id),
-                ('id', '!=', record.id)
-            ])
-            if existing:
-                raise ValidationError(
-                    _("Power capacity %s is already defined for this reference cost.") % 
-                    record.power_capacity_id.name
-                )
+    def _raise_duplicate_key(self, key, existing):
+        capacity = self.env['sparks.solar.kit.capacity'].browse(key[1])
+        raise ValidationError(
+            _("Power capacity %s is already defined for this reference cost.") % 
+            capacity.name
+        )
@@ -13,7 +13,13 @@ _logger.info("=== LOADING SPARKS CONSUMPTION LINE MODEL ===")
 class ConsumptionLine(models.Model):
     _name = 'sparks.consumption.line'
     _description = 'Monthly Energy Consumption Line'
+    _inherit = ['sparks.unique.key.mixin']
     _order = 'month'
+    _unique_key = ('quotation_id', 'month')
+    _sql_constraints = [
+        ('quotation_month_unique', 'unique(quotation_id, month)',
+         'Each month can only be defined once per quotation.'),
+    ]
 
     quotation_id = fields.Many2one(
         'sparks.solar.quotation', 
@@ -46,19 +52,11 @@ class ConsumptionLine(models.Model):
         store=True
     )
 
-    @api.constrains('month', 'quotation_id')
-    def _check_unique_month(self):
-        for record in self:
-            existing = self.search([
-                ('quotation_id', '=', record.quotation_id.id),
-                ('month', '=', record.month),
-                ('id', '!=', record.id)
-            ])
-            if existing:
-                month_name = dict(self._fields['month'].selection)[record.month]
-                raise ValidationError(
-                    _("Month %s is already defined for this quotation.") % month_name
-                )
+    def _raise_duplicate_key(self, key, existing):
+        month_name = dict(self._fields['month'].selection)[key[1]]
+        raise ValidationError(
+            _("Month %s is already defined for this quotation.") % month_name
+        )
 
     @api.constrains('energy_kwh')
     def _check_positive_consumption(self):
@@ -1,14 +1,37 @@
 # -*- coding: utf-8 -*-
 
+import logging
+import operator as py_operator
+
 from odoo import models, fields, api, _
-from odoo.exceptions import ValidationError
+from odoo.exceptions import UserError, ValidationError
+from odoo.tools import SQL, float_compare, split_every
+from odoo.tools.sql import create_index
+
+_logger = logging.getLogger(__name__)
+
+# Operators of the quotation count search, evaluated on 0 for the meters
+# that have no row in quotation_meter_rel
+COUNT_OPERATORS = {
+    '=': py_operator.eq,
+    '!=': py_operator.ne,
+    '<': py_operator.lt,
+    '<=': py_operator.le,
+    '>': py_operator.gt,
+    '>=': py_operator.ge,
+}
 
 
 class EnergyMeter(models.Model):
     _name = 'sparks.energy.meter'
     _description = 'Energy Meter'
-    _inherit = ['mail.thread', 'mail.activity.mixin']
+    _inherit = ['mail.thread', 'mail.activity.mixin', 'sparks.unique.key.mixin']
     _rec_name = 'display_name'
+    _unique_key = ('supply_number',)
+    _sql_constraints = [
+        ('supply_number_unique', 'unique(supply_number)',
+         'The supply number must be unique per meter.'),
+    ]
 
     # Basic Information
     name = fields.Char(
@@ -88,34 +111,34 @@ class EnergyMeter(models.Model):
         string='Solar Quotations'
     )
     
+    # Not stored: searches go through the grouped subquery of the relation
     quotation_count = fields.Integer(
         string='Quotations Count',
         compute='_compute_quotation_count',
-        store=True,  # ✅ AGREGADO: Almacenar en BD para que sea buscable
-        search='_search_quotation_count'  # ✅ AGREGADO: Hacer buscable
+        search='_search_quotation_count'
     )
     
     
-    # Computed Statistics
+    # Consumption Statistics, maintained incrementally by sparks.meter.consumption
+    consumption_bill_count = fields.Integer(
+        string='Consumption Records',
+        readonly=True
+    )
     average_monthly_consumption = fields.Float(
         string='Average Monthly Consumption (kWh)',
-        compute='_compute_consumption_stats',
-        store=True
+        readonly=True
     )
     peak_monthly_consumption = fields.Float(
         string='Peak Monthly Consumption (kWh)',
-        compute='_compute_consumption_stats',
-        store=True
+        readonly=True
     )
     total_annual_consumption = fields.Float(
         string='Annual Consumption (kWh)',
-        compute='_compute_consumption_stats',
-        store=True
+        readonly=True
     )
     last_12_months_consumption = fields.Float(
         string='Last 12 Months Consumption (kWh)',
-        compute='_compute_consumption_stats',
-        store=True
+        readonly=True
     )
     
     # Display name
@@ -150,36 +173,178 @@ class EnergyMeter(models.Model):
         for meter in self:
             meter.quotation_count = len(meter.quotation_ids)
 
-    @api.depends('consumption_line_ids.energy_kwh')
-    def _compute_consumption_stats(self):
-        for meter in self:
-            consumptions = meter.consumption_line_ids
-            if consumptions:
-                consumption_values = consumptions.mapped('energy_kwh')
-                meter.total_annual_consumption = sum(consumption_values)
-                meter.average_monthly_consumption = meter.total_annual_consumption / len(consumption_values) if consumption_values else 0
-                meter.peak_monthly_consumption = max(consumption_values) if consumption_values else 0
-                
-                # Last 12 months (assuming we have chronological data)
-                recent_consumptions = consumptions.sorted('year_month', reverse=True)[:12]
-                meter.last_12_months_consumption = sum(recent_consumptions.mapped('energy_kwh'))
-            else:
-                meter.total_annual_consumption = 0
-                meter.average_monthly_consumption = 0
-                meter.peak_monthly_consumption = 0
-                meter.last_12_months_consumption = 0
+    def _read_consumption_stats(self):
+        """Consumption statistics of the meters in one grouped query
+
+        Returns ``{meter id: (bill count, total kWh, peak kWh, last 12 months kWh)}``;
+        the last 12 months are the 12 most recent bills of each meter.
+        """
+        if not self:
+            return {}
+        self.env['sparks.meter.consumption'].flush_model(['meter_id', 'year', 'month', 'energy_kwh'])
+        self.env.cr.execute("""
+            SELECT meter_id,
+                   COUNT(*),
+                   SUM(energy_kwh),
+                   MAX(energy_kwh),
+                   SUM(energy_kwh) FILTER (WHERE recent_rank <= 12)
+              FROM (
+                  SELECT meter_id, energy_kwh,
+                         ROW_NUMBER() OVER (
+                             PARTITION BY meter_id
+                             ORDER BY year DESC, month::integer DESC
+                         ) AS recent_rank
+                    FROM sparks_meter_consumption
+                   WHERE meter_id = ANY(%s)
+              ) consumption
+             GROUP BY meter_id
+        """, [self.ids])
+        return {row[0]: row[1:] for row in self.env.cr.fetchall()}
+
+    def _read_recent_consumption_by_month(self):
+        """Consumption of the 12 most recent bills of each meter, by month
+
+        This query defines the last 12 months of a meter for every caller.
+        It runs once for the whole recordset and reads at most 12 rows per
+        meter through the (meter_id, year_month) index, whatever the length
+        of the history.
+
+        :return: ``{meter id: {month: (kWh, cost)}}``, without the meters
+            that have no bill
+        """
+        if not self:
+            return {}
+        self.env['sparks.meter.consumption'].flush_model(
+            ['meter_id', 'year_month', 'month', 'energy_kwh', 'energy_cost'])
+        self.env.cr.execute("""
+            SELECT meter.id, recent.month, SUM(recent.energy_kwh), SUM(COALESCE(recent.energy_cost, 0))
+              FROM unnest(%s::integer[]) AS meter(id)
+              JOIN LATERAL (
+                  SELECT consumption.month, consumption.energy_kwh, consumption.energy_cost
+                    FROM sparks_meter_consumption consumption
+                   WHERE consumption.meter_id = meter.id
+                   ORDER BY consumption.year_month DESC
+                   LIMIT 12
+              ) recent ON TRUE
+             GROUP BY meter.id, recent.month
+        """, [self.ids])
+        result = {}
+        for meter_id, month, energy_kwh, energy_cost in self.env.cr.fetchall():
+            result.setdefault(meter_id, {})[month] = (energy_kwh, energy_cost)
+        return result
+
+    def _read_recent_consumption(self):
+        """Sum of the 12 most recent bills per meter: ``{meter id: kWh}``"""
+        return {
+            meter_id: sum(energy_kwh for energy_kwh, _energy_cost in months.values())
+            for meter_id, months in self._read_recent_consumption_by_month().items()
+        }
+
+    def _read_recent_monthly_consumption(self):
+        """Monthly totals of the 12 most recent bills of all meters of self
+
+        :return: ``[(month, kWh, cost)]`` ordered by month
+        """
+        totals = {}
+        for months in self._read_recent_consumption_by_month().values():
+            for month, (energy_kwh, energy_cost) in months.items():
+                kwh, cost = totals.get(month, (0.0, 0.0))
+                totals[month] = (kwh + energy_kwh, cost + energy_cost)
+        return [(month, *totals[month]) for month in sorted(totals, key=int)]
+
+    def _read_peak_consumption(self):
+        """Highest bill per meter: ``{meter id: kWh}``"""
+        if not self:
+            return {}
+        self.env['sparks.meter.consumption'].flush_model(['meter_id', 'energy_kwh'])
+        self.env.cr.execute("""
+            SELECT meter_id, MAX(energy_kwh)
+              FROM sparks_meter_consumption
+             WHERE meter_id = ANY(%s)
+             GROUP BY meter_id
+        """, [self.ids])
+        return dict(self.env.cr.fetchall())
+
+    def _apply_consumption_changes(self, removed, added):
+        """Update the running statistics with the bills removed and added
+
+        ``removed`` and ``added`` map meter ids to lists of kWh values.
+        Count and total are adjusted, the peak only needs a query when the
+        current peak bill is removed, and the last-12-months window is
+        re-read for the touched meters only.
+        """
+        meters = self.browse(list(set(removed) | set(added))).exists()
+        peak_lost = self.browse()
+        for meter in meters:
+            old_values = removed.get(meter.id, [])
+            new_values = added.get(meter.id, [])
+            count = meter.consumption_bill_count - len(old_values) + len(new_values)
+            total = meter.total_annual_consumption - sum(old_values) + sum(new_values)
+            vals = {
+                'consumption_bill_count': count,
+                'total_annual_consumption': total if count else 0,
+                'average_monthly_consumption': total / count if count else 0,
+            }
+            if old_values and max(old_values) >= meter.peak_monthly_consumption:
+                peak_lost |= meter
+            elif new_values:
+                vals['peak_monthly_consumption'] = max(meter.peak_monthly_consumption, max(new_values))
+            meter.write(vals)
+
+        peaks = peak_lost._read_peak_consumption()
+        for meter in peak_lost:
+            meter.peak_monthly_consumption = peaks.get(meter.id, 0)
+
+        recent = meters._read_recent_consumption()
+        for meter in meters:
+            meter.last_12_months_consumption = recent.get(meter.id, 0)
 
-    @api.constrains('supply_number')
-    def _check_unique_supply_number(self):
+    def _recompute_consumption_stats(self):
+        """Recompute the consumption statistics from the full history"""
+        stats = self._read_consumption_stats()
         for meter in self:
-            if meter.supply_number:
-                existing = self.search([
-                    ('supply_number', '=', meter.supply_number),
-                    ('id', '!=', meter.id)
-                ])
-                if existing:
-                    raise ValidationError(_("Supply number '%s' already exists for meter '%s'") % 
-                                        (meter.supply_number, existing.display_name))
+            count, total, peak, last_12_months = stats.get(meter.id, (0, 0.0, 0.0, 0.0))
+            meter.write({
+                'consumption_bill_count': count,
+                'total_annual_consumption': total,
+                'average_monthly_consumption': total / count if count else 0,
+                'peak_monthly_consumption': peak,
+                'last_12_months_consumption': last_12_months,
+            })
+        self.flush_recordset()
+
+    @api.model
+    def _cron_verify_consumption_stats(self, batch_size=5000):
+        """Detect and repair drift between running and recomputed statistics"""
+        fnames = [
+            'consumption_bill_count', 'total_annual_consumption',
+            'peak_monthly_consumption', 'last_12_months_consumption',
+        ]
+        drifted = self.browse()
+        meters = self.with_context(active_test=False).search([])
+        for start in range(0, len(meters), batch_size):
+            batch = meters[start:start + batch_size]
+            stats = batch._read_consumption_stats()
+            for meter in batch:
+                expected = stats.get(meter.id, (0, 0.0, 0.0, 0.0))
+                actual = [meter[fname] for fname in fnames]
+                if any(float_compare(a, e or 0, precision_digits=4) for a, e in zip(actual, expected)):
+                    drifted |= meter
+            batch.invalidate_recordset()
+        if drifted:
+            _logger.warning(
+                "Consumption statistics drifted on %d meters, recomputing: %s",
+                len(drifted), drifted.ids[:50],
+            )
+            drifted._recompute_consumption_stats()
+        return drifted
+
+    def _raise_duplicate_key(self, key, existing):
+        if not existing:
+            raise ValidationError(
+                _("Supply number '%s' appears more than once in the imported batch") % key[0])
+        raise ValidationError(
+            _("Supply number '%s' already exists for meter '%s'") % (key[0], existing.display_name))
 
 
     @api.onchange('city_id')
@@ -250,36 +415,36 @@ class EnergyMeter(models.Model):
         }
 
     def _search_quotation_count(self, operator, value):
-        """Search method for quotation_count field"""
-        # Buscar metros que tengan quotations
-        if operator == '>' and value == 0:
-            return [('quotation_ids', '!=', False)]
-        elif operator == '=' and value == 0:
-            return [('quotation_ids', '=', False)]
-        else:
-            # Para otros casos, usar la cuenta real
-            meters = self.search([])
-            meter_ids = []
-            for meter in meters:
-                count = len(meter.quotation_ids)
-                if operator == '=' and count == value:
-                    meter_ids.append(meter.id)
-                elif operator == '>' and count > value:
-                    meter_ids.append(meter.id)
-                elif operator == '<' and count < value:
-                    meter_ids.append(meter.id)
-                elif operator == '>=' and count >= value:
-                    meter_ids.append(meter.id)
-                elif operator == '<=' and count <= value:
-                    meter_ids.append(meter.id)
-                elif operator == '!=' and count != value:
-                    meter_ids.append(meter.id)
-            return [('id', 'in', meter_ids)]
+        """Search method for quotation_count field
+
+        Counts are grouped in quotation_meter_rel and filtered with HAVING,
+        so the condition stays a subquery of the search.  Meters without
+        quotations have no row there: when a count of 0 satisfies the
+        condition, the meters failing it are excluded instead.
+        """
+        if operator not in COUNT_OPERATORS:
+            raise UserError(_("Operation not supported: %s") % operator)
+        value = int(value or 0)
+        zero_matches = COUNT_OPERATORS[operator](0, value)
+        condition = SQL("COUNT(*) %s %s", SQL(operator), value)
+        if zero_matches:
+            condition = SQL("NOT (%s)", condition)
+        subquery = SQL(
+            "(SELECT meter_id FROM quotation_meter_rel GROUP BY meter_id HAVING %s)",
+            condition,
+        )
+        return [('id', 'not in' if zero_matches else 'in', subquery)]
 
 class MeterConsumption(models.Model):
     _name = 'sparks.meter.consumption'
     _description = 'Historical Energy Consumption by Meter'
+    _inherit = ['sparks.unique.key.mixin']
     _order = 'year_month desc'
+    _unique_key = ('meter_id', 'year', 'month')
+    _sql_constraints = [
+        ('meter_year_month_unique', 'unique(meter_id, year, month)',
+         'Consumption can only be recorded once per meter and month.'),
+    ]
 
     meter_id = fields.Many2one(
         'sparks.energy.meter', 
@@ -335,29 +500,132 @@ class MeterConsumption(models.Model):
     # Notes
     notes = fields.Text(string='Notes')
 
+    def init(self):
+        # Serves the most-recent-bills lookups of the running statistics
+        create_index(
+            self.env.cr, 'sparks_meter_consumption_meter_year_month_index',
+            self._table, ['meter_id', 'year_month'],
+        )
+        # The running statistics of the meters billed before they were
+        # maintained incrementally start from an empty bill count
+        self.env.cr.execute("""
+            SELECT meter.id
+              FROM sparks_energy_meter meter
+             WHERE COALESCE(meter.consumption_bill_count, 0) = 0
+               AND EXISTS (SELECT 1 FROM sparks_meter_consumption bill WHERE bill.meter_id = meter.id)
+        """)
+        meters = self.env['sparks.energy.meter'].browse(row[0] for row in self.env.cr.fetchall())
+        if meters:
+            _logger.info("Initializing the consumption statistics of %d meters", len(meters))
+            meters._recompute_consumption_stats()
+
+    def _get_values_by_meter(self):
+        values = {}
+        for record in self:
+            values.setdefault(record.meter_id.id, []).append(record.energy_kwh)
+        return values
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self.env['sparks.energy.meter']._apply_consumption_changes({}, records._get_values_by_meter())
+        return records
+
+    def write(self, vals):
+        if not {'meter_id', 'energy_kwh', 'year', 'month'} & set(vals):
+            return super().write(vals)
+        removed = self._get_values_by_meter()
+        res = super().write(vals)
+        self.env['sparks.energy.meter']._apply_consumption_changes(removed, self._get_values_by_meter())
+        return res
+
+    def unlink(self):
+        removed = self._get_values_by_meter()
+        res = super().unlink()
+        self.env['sparks.energy.meter']._apply_consumption_changes(removed, {})
+        return res
+
+    @api.model
+    def _upsert_consumption(self, rows, batch_size=1000):
+        """Insert or update consumption rows in bulk SQL
+
+        ``rows`` are dicts with meter_id, year, month and energy_kwh, and
+        optionally energy_cost, max_demand_kw, peak_hours_kwh and
+        off_peak_hours_kwh; missing or None optional values keep the
+        stored ones.  Rows are matched on the (meter_id, year, month)
+        unique constraint and only changed rows are rewritten, so loading
+        the same export twice is a no-op.  Statistics of the touched
+        meters are refreshed once at the end.
+
+        :return: (inserted, updated, unchanged) counts
+        """
+        # Within one statement a key may only appear once: last row wins
+        rows = {(row['meter_id'], row['year'], row['month']): row for row in rows}
+        if not rows:
+            return 0, 0, 0
+
+        self.flush_model()
+        now = fields.Datetime.now()
+        currency_id = self.env.company.currency_id.id
+        inserted = updated = 0
+        for batch in split_every(batch_size, rows.values()):
+            values = [(
+                row['meter_id'], row['year'], row['month'],
+                f"{row['year']}-{int(row['month']):02d}",
+                row['energy_kwh'], row.get('energy_cost'), row.get('max_demand_kw'),
+                row.get('peak_hours_kwh'), row.get('off_peak_hours_kwh'),
+                currency_id, self.env.uid, now, self.env.uid, now,
+            ) for row in batch]
+            self.env.cr.execute("""
+                INSERT INTO sparks_meter_consumption AS mc (
+                    meter_id, year, month, year_month,
+                    energy_kwh, energy_cost, max_demand_kw,
+                    peak_hours_kwh, off_peak_hours_kwh,
+                    currency_id, create_uid, create_date, write_uid, write_date
+                )
+                VALUES {placeholders}
+                ON CONFLICT (meter_id, year, month) DO UPDATE SET
+                    energy_kwh = EXCLUDED.energy_kwh,
+                    energy_cost = COALESCE(EXCLUDED.energy_cost, mc.energy_cost),
+                    max_demand_kw = COALESCE(EXCLUDED.max_demand_kw, mc.max_demand_kw),
+                    peak_hours_kwh = COALESCE(EXCLUDED.peak_hours_kwh, mc.peak_hours_kwh),
+                    off_peak_hours_kwh = COALESCE(EXCLUDED.off_peak_hours_kwh, mc.off_peak_hours_kwh),
+                    write_uid = EXCLUDED.write_uid,
+                    write_date = EXCLUDED.write_date
+                WHERE (mc.energy_kwh, mc.energy_cost, mc.max_demand_kw,
+                       mc.peak_hours_kwh, mc.off_peak_hours_kwh)
+                    IS DISTINCT FROM
+                      (EXCLUDED.energy_kwh,
+                       COALESCE(EXCLUDED.energy_cost, mc.energy_cost),
+                       COALESCE(EXCLUDED.max_demand_kw, mc.max_demand_kw),
+                       COALESCE(EXCLUDED.peak_hours_kwh, mc.peak_hours_kwh),
+                       COALESCE(EXCLUDED.off_peak_hours_kwh, mc.off_peak_hours_kwh))
+                RETURNING xmax = 0
+            """.format(placeholders=', '.join(['%s'] * len(values))), values)
+            written = [is_insert for is_insert, in self.env.cr.fetchall()]
+            inserted += sum(written)
+            updated += len(written) - sum(written)
+
+        self.invalidate_model()
+        meters = self.env['sparks.energy.meter'].browse({meter_id for meter_id, _year, _month in rows})
+        meters._recompute_consumption_stats()
+        return inserted, updated, len(rows) - inserted - updated
+
     @api.depends('year', 'month')
     def _compute_year_month(self):
         for record in self:
             if record.year and record.month:
-                record.year_month = f"{record.year}-{record.month:02d}"
+                record.year_month = f"{record.year}-{int(record.month):02d}"
             else:
                 record.year_month = ""
 
-    @api.constrains('year', 'month', 'meter_id')
-    def _check_unique_month_per_meter(self):
-        for record in self:
-            existing = self.search([
-                ('meter_id', '=', record.meter_id.id),
-                ('year', '=', record.year),
-                ('month', '=', record.month),
-                ('id', '!=', record.id)
-            ])
-            if existing:
-                month_name = dict(self._fields['month'].selection)[record.month]
-                raise ValidationError(
-                    _("Consumption for %s %d already exists for meter '%s'") % 
-                    (month_name, record.year, record.meter_id.display_name)
-                )
+    def _raise_duplicate_key(self, key, existing):
+        meter_id, year, month = key
+        month_name = dict(self._fields['month'].selection)[month]
+        raise ValidationError(
+            _("Consumption for %s %d already exists for meter '%s'") % 
+            (month_name, year, self.env['sparks.energy.meter'].browse(meter_id).display_name)
+        )
 
     @api.constrains('energy_kwh')
     def _check_positive_consumption(self):
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+from odoo.exceptions import ValidationError
+
+
+class CacheInvalidationMixin(models.AbstractModel):
+    _name = 'sparks.cache.invalidation.mixin'
+    _description = 'Clears cached master data when records change'
+
+    def _invalidate_sparks_cache(self):
+        # Clearing the registry cache is signalled to every other worker
+        self.env.registry.clear_cache()
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self._invalidate_sparks_cache()
+        return records
+
+    def write(self, vals):
+        res = super().write(vals)
+        self._invalidate_sparks_cache()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self._invalidate_sparks_cache()
+        return res
+
+
+class PricingPropagationMixin(models.AbstractModel):
+    _name = 'sparks.pricing.propagation.mixin'
+    _inherit = ['sparks.cache.invalidation.mixin']
+    _description = 'Reprices open quotations when kit costs or prices change'
+
+    @api.model
+    def _get_pricing_snapshot(self):
+        """Kit cost index and energy price projections the quotations are priced with"""
+        current_year = fields.Date.today().year
+        return (
+            self.env['sparks.solar.kit.reference']._get_cost_index(current_year),
+            tuple(
+                (name, projected, inflation)
+                for name, _actual, projected, inflation in self.env['sparks.energy.projection']._get_price_table()
+            ),
+        )
+
+    @api.model
+    def _propagate_pricing(self, snapshot):
+        """Reprice the quotations affected by the difference with ``snapshot``"""
+        old_index, old_prices = snapshot
+        new_index, new_prices = self._get_pricing_snapshot()
+        Quotation = self.env['sparks.solar.quotation']
+        Quotation._propagate_pricing_change(
+            power_ranges=old_index.changed_ranges(new_index, Quotation._use_kit_cost_interpolation()),
+            price_changed=old_prices != new_prices,
+        )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        snapshot = self._get_pricing_snapshot()
+        records = super().create(vals_list)
+        self._propagate_pricing(snapshot)
+        return records
+
+    def write(self, vals):
+        snapshot = self._get_pricing_snapshot()
+        res = super().write(vals)
+        self._propagate_pricing(snapshot)
+        return res
+
+    def unlink(self):
+        snapshot = self._get_pricing_snapshot()
+        res = super().unlink()
+        self._propagate_pricing(snapshot)
+        return res
+
+
+class UniqueKeyMixin(models.AbstractModel):
+    _name = 'sparks.unique.key.mixin'
+    _description = 'Set-based uniqueness validation of a composite key'
+
+    # Fields forming the key, also covered by a unique SQL constraint
+    _unique_key = ()
+
+    def _raise_duplicate_key(self, key, existing):
+        """Raise the user-facing error for ``key``
+
+        ``existing`` is the stored record holding the key, or an empty
+        recordset when the duplicate is within the batch itself.  The
+        default message names the model and the key values.
+        """
+        raise ValidationError(_("%s '%s' already exists.") % (
+            self._description, ', '.join(str(value) for value in key)))
+
+    def _get_key_from_vals(self, vals, record=None):
+        key = []
+        for fname in self._unique_key:
+            field = self._fields[fname]
+            if fname in vals:
+                value = field.convert_to_column(vals[fname], self)
+            elif record is not None:
+                value = field.convert_to_column(field.convert_to_write(record[fname], record), record)
+            else:
+                value = None
+            if value is None or value is False:
+                return None  # Like the SQL constraint, keys with NULLs never clash
+            key.append(value)
+        return tuple(key)
+
+    def _check_unique_keys(self, keys, exclude_ids=(), batch_size=1000):
+        """Validate a batch of keys with one grouped query per ``batch_size`` keys"""
+        seen = set()
+        for key in keys:
+            if key is None:
+                continue
+            if key in seen:
+                self._raise_duplicate_key(key, self.browse())
+            seen.add(key)
+
+        keys = list(seen)
+        columns = ', '.join('"%s"' % fname for fname in self._unique_key)
+        self.flush_model(list(self._unique_key))
+        for start in range(0, len(keys), batch_size):
+            self.env.cr.execute(
+                'SELECT id, %s FROM "%s" WHERE (%s) IN %%s AND NOT (id = ANY(%%s)) LIMIT 1'
+                % (columns, self._table, columns),
+                [tuple(keys[start:start + batch_size]), list(exclude_ids)],
+            )
+            row = self.env.cr.fetchone()
+            if row:
+                self._raise_duplicate_key(tuple(row[1:]), self.browse(row[0]))
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self._check_unique_keys([self._get_key_from_vals(vals) for vals in vals_list])
+        return super().create(vals_list)
+
+    def write(self, vals):
+        if set(self._unique_key) & set(vals):
+            self._check_unique_keys(
+                [self._get_key_from_vals(vals, record) for record in self],
+                exclude_ids=self.ids,
+            )
+        return super().write(vals)
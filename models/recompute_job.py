@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from odoo.tools.safe_eval import safe_eval
+
+_logger = logging.getLogger(__name__)
+
+# Method recomputing the stored figures of a batch of records, per model
+RECOMPUTE_METHODS = {
+    'sparks.solar.quotation': '_recompute_system_calculations',
+    'sparks.energy.meter': '_recompute_consumption_stats',
+    'res.partner': '_recompute_energy_stats',
+}
+
+# Narrower methods a job may run instead, per model
+PARTIAL_RECOMPUTE_METHODS = {
+    'sparks.solar.quotation': ('_recompute_financial_data',),
+}
+
+
+class RecomputeJob(models.Model):
+    _name = 'sparks.recompute.job'
+    _description = 'Background Recompute Job'
+    _order = 'id desc'
+
+    name = fields.Char(string='Description', required=True)
+    model_name = fields.Selection([
+        ('sparks.solar.quotation', 'Solar Quotations'),
+        ('sparks.energy.meter', 'Energy Meters'),
+        ('res.partner', 'Customers'),
+    ], string='Records', required=True)
+    domain = fields.Char(
+        string='Domain',
+        default='[]',
+        help="Extra filter applied when each chunk is processed"
+    )
+    method_name = fields.Char(
+        string='Method',
+        required=True,
+        readonly=True,
+        help="Method run on the records of each chunk"
+    )
+    chunk_size = fields.Integer(string='Chunk Size', default=1000)
+    max_retries = fields.Integer(
+        string='Max Retries',
+        default=3,
+        help="Number of attempts of a failing chunk before it is given up"
+    )
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ], string='Status', default='pending', required=True, index=True)
+
+    chunk_ids = fields.One2many(
+        'sparks.recompute.job.chunk',
+        'job_id',
+        string='Chunks'
+    )
+    total_records = fields.Integer(string='Total Records', readonly=True)
+    processed_records = fields.Integer(
+        string='Processed Records',
+        compute='_compute_progress'
+    )
+    progress = fields.Float(
+        string='Progress (%)',
+        compute='_compute_progress'
+    )
+    records_per_second = fields.Float(
+        string='Throughput (records/s)',
+        compute='_compute_progress'
+    )
+    failed_chunk_count = fields.Integer(
+        string='Failed Chunks',
+        compute='_compute_progress'
+    )
+    started_at = fields.Datetime(string='Started', readonly=True)
+    finished_at = fields.Datetime(string='Finished', readonly=True)
+
+    @api.depends('chunk_ids.state', 'chunk_ids.record_count', 'chunk_ids.duration', 'total_records')
+    def _compute_progress(self):
+        for job in self:
+            done_chunks = job.chunk_ids.filtered(lambda c: c.state == 'done')
+            processed = sum(done_chunks.mapped('record_count'))
+            duration = sum(done_chunks.mapped('duration'))
+            job.processed_records = processed
+            job.progress = (processed / job.total_records * 100) if job.total_records else 0.0
+            job.records_per_second = processed / duration if duration else 0.0
+            job.failed_chunk_count = len(job.chunk_ids.filtered(lambda c: c.state == 'failed'))
+
+    @api.model
+    def _enqueue(self, records, name=None, domain=None, chunk_size=1000, method=None):
+        """Create a job recomputing ``records`` in chunks of at most ``chunk_size``
+
+        ``records`` is a recordset of one of the supported models, or a
+        model name together with ``domain``.  Each chunk keeps the ids it
+        was given: only those records are recomputed, however sparse the
+        selection.  ``method`` replaces the full recomputation of the model
+        by one of its ``PARTIAL_RECOMPUTE_METHODS``.  The cron runner is
+        triggered right away.  Any user whose changes need a mass
+        recomputation may enqueue a job, only managers may manage them.
+        """
+        if isinstance(records, str):
+            records = self.env[records].with_context(active_test=False).search(domain or [])
+        if records._name not in RECOMPUTE_METHODS:
+            raise UserError(_("Records of %s cannot be recomputed in background.") % records._name)
+        if method and method not in PARTIAL_RECOMPUTE_METHODS.get(records._name, ()):
+            raise UserError(_("%s cannot be run on %s in background.") % (method, records._description))
+
+        ids = sorted(records.ids)
+        job = self.sudo().create({
+            'name': name or _('Recompute %s') % records._description,
+            'model_name': records._name,
+            'method_name': method or RECOMPUTE_METHODS[records._name],
+            'domain': repr(domain or []),
+            'chunk_size': chunk_size,
+            'total_records': len(ids),
+            'chunk_ids': [(0, 0, {
+                'sequence': index,
+                'start_id': chunk[0],
+                'end_id': chunk[-1],
+                'record_ids': chunk,
+                'record_count': len(chunk),
+            }) for index, chunk in enumerate(
+                ids[start:start + chunk_size] for start in range(0, len(ids), chunk_size)
+            )],
+        })
+        self.env.ref('sparks.ir_cron_process_recompute_jobs')._trigger()
+        return job.with_env(self.env)
+
+    def action_retry_failed(self):
+        """Give the failed chunks a fresh set of attempts"""
+        chunks = self.chunk_ids.filtered(lambda c: c.state == 'failed')
+        chunks.write({'state': 'pending', 'attempts': 0, 'error': False})
+        self.filtered(lambda j: j.state == 'failed').write({'state': 'pending', 'finished_at': False})
+        self.env.ref('sparks.ir_cron_process_recompute_jobs')._trigger()
+        return True
+
+    def action_cancel(self):
+        self.filtered(lambda j: j.state in ('pending', 'running')).write({
+            'state': 'cancelled',
+            'finished_at': fields.Datetime.now(),
+        })
+        return True
+
+    @api.model
+    def _cron_process_jobs(self, time_limit=240):
+        """Process pending chunks, committing after each one
+
+        Chunks left running by an interrupted worker are resumed. When the
+        time limit is reached the cron is triggered again for the rest.
+        """
+        Chunk = self.env['sparks.recompute.job.chunk']
+        Chunk.search([('state', '=', 'running')]).write({'state': 'pending'})
+        self.env.cr.commit()
+
+        deadline = time.monotonic() + time_limit
+        for job in self.search([('state', 'in', ('pending', 'running'))], order='id'):
+            if not job._process_chunks(deadline):
+                self.env.ref('sparks.ir_cron_process_recompute_jobs')._trigger()
+                return
+
+    def _process_chunks(self, deadline):
+        """Run the remaining chunks of the job, return False when out of time"""
+        self.ensure_one()
+        if self.state == 'pending':
+            self.write({'state': 'running', 'started_at': fields.Datetime.now()})
+            self.env.cr.commit()
+
+        while True:
+            chunk = self.chunk_ids.filtered(
+                lambda c: c.state == 'pending'
+                or (c.state == 'failed' and c.attempts < self.max_retries)
+            )[:1]
+            if not chunk:
+                break
+            if time.monotonic() > deadline:
+                return False
+            chunk._run()
+
+        failed = self.chunk_ids.filtered(lambda c: c.state == 'failed')
+        self.write({
+            'state': 'failed' if failed else 'done',
+            'finished_at': fields.Datetime.now(),
+        })
+        self.env.cr.commit()
+        _logger.info(
+            "Recompute job %s finished: %d records, %.0f records/s, %d failed chunks",
+            self.name, self.processed_records, self.records_per_second, len(failed),
+        )
+        return True
+
+
+class RecomputeJobChunk(models.Model):
+    _name = 'sparks.recompute.job.chunk'
+    _description = 'Background Recompute Job Chunk'
+    _order = 'job_id, sequence'
+
+    job_id = fields.Many2one(
+        'sparks.recompute.job',
+        string='Job',
+        required=True,
+        ondelete='cascade',
+        index=True
+    )
+    sequence = fields.Integer(string='Sequence')
+    start_id = fields.Integer(string='From ID', required=True)
+    end_id = fields.Integer(string='To ID', required=True)
+    record_ids = fields.Json(string='Record IDs', required=True)
+    record_count = fields.Integer(string='Records')
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ], string='Status', default='pending', required=True, index=True)
+    attempts = fields.Integer(string='Attempts')
+    duration = fields.Float(string='Duration (s)')
+    error = fields.Text(string='Last Error')
+
+    def _get_records(self):
+        """Records of the chunk still existing and matching the job domain"""
+        self.ensure_one()
+        domain = [('id', 'in', self.record_ids)]
+        domain += safe_eval(self.job_id.domain or '[]')
+        return self.env[self.job_id.model_name].with_context(active_test=False).search(domain)
+
+    def _run(self):
+        """Recompute the records of the chunk in its own transaction"""
+        self.ensure_one()
+        self.write({'state': 'running', 'attempts': self.attempts + 1})
+        self.env.cr.commit()
+
+        start = time.perf_counter()
+        try:
+            records = self._get_records()
+            getattr(records, self.job_id.method_name)()
+            records.flush_model()
+        except Exception as e:
+            self.env.cr.rollback()
+            _logger.exception("Recompute job chunk %s-%s failed", self.start_id, self.end_id)
+            self.write({'state': 'failed', 'error': str(e)})
+        else:
+            self.write({
+                'state': 'done',
+                'duration': time.perf_counter() - start,
+                'error': False,
+            })
+        self.env.cr.commit()
+        self.env.invalidate_all()
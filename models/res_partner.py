@@ -14,7 +14,8 @@ class ResPartner(models.Model):
     )
     energy_meter_count = fields.Integer(
         string='Energy Meters Count',
-        compute='_compute_energy_meter_count'
+        compute='_compute_energy_meter_count',
+        store=True
     )
 
     # Solar quotation related fields
@@ -25,18 +26,21 @@ class ResPartner(models.Model):
     )
     solar_quotation_count = fields.Integer(
         string='Solar Quotations Count',
-        compute='_compute_solar_quotation_count'
+        compute='_compute_solar_quotation_count',
+        store=True
     )
     
     # Energy consumption information
     total_monthly_consumption = fields.Float(
         string='Total Monthly Consumption (kWh)',
         compute='_compute_energy_stats',
+        store=True,
         help="Sum of average monthly consumption from all meters"
     )
     total_installed_capacity = fields.Float(
         string='Total Installed Capacity (kW)',
         compute='_compute_energy_stats',
+        store=True,
         help="Total solar capacity from confirmed quotations"
     )
     
@@ -57,29 +61,60 @@ class ResPartner(models.Model):
     
     energy_goals = fields.Text(string='Energy Goals & Requirements')
 
+    def _read_group_by_partner(self, model, domain, aggregate):
+        """Aggregate of ``model`` records per saved partner of self, in one query"""
+        groups = self.env[model]._read_group(
+            [('partner_id', 'in', self.filtered('id').ids)] + domain, ['partner_id'], [aggregate],
+        )
+        return {partner.id: value for partner, value in groups}
+
+    # Saved partners are computed with grouped queries, new records being
+    # edited in a form from the lines in cache
+
     @api.depends('energy_meter_ids')
     def _compute_energy_meter_count(self):
+        counts = self._read_group_by_partner('sparks.energy.meter', [], '__count')
         for partner in self:
-            partner.energy_meter_count = len(partner.energy_meter_ids)
+            if partner.id:
+                partner.energy_meter_count = counts.get(partner.id, 0)
+            else:
+                partner.energy_meter_count = len(partner.energy_meter_ids)
 
     @api.depends('solar_quotation_ids')
     def _compute_solar_quotation_count(self):
+        counts = self._read_group_by_partner('sparks.solar.quotation', [], '__count')
         for partner in self:
-            partner.solar_quotation_count = len(partner.solar_quotation_ids)
+            if partner.id:
+                partner.solar_quotation_count = counts.get(partner.id, 0)
+            else:
+                partner.solar_quotation_count = len(partner.solar_quotation_ids)
 
     @api.depends('energy_meter_ids.average_monthly_consumption', 'solar_quotation_ids.system_power_kw', 'solar_quotation_ids.state')
     def _compute_energy_stats(self):
+        # Total consumption from all meters
+        consumptions = self._read_group_by_partner(
+            'sparks.energy.meter', [], 'average_monthly_consumption:sum')
+        # Total installed capacity from confirmed quotations
+        capacities = self._read_group_by_partner(
+            'sparks.solar.quotation', [('state', '=', 'confirmed')], 'system_power_kw:sum')
         for partner in self:
-            # Calculate total consumption from all meters
-            meters = partner.energy_meter_ids
-            if meters:
-                partner.total_monthly_consumption = sum(meters.mapped('average_monthly_consumption'))
+            if partner.id:
+                partner.total_monthly_consumption = consumptions.get(partner.id) or 0.0
+                partner.total_installed_capacity = capacities.get(partner.id) or 0.0
             else:
-                partner.total_monthly_consumption = 0.0
-            
-            # Calculate total installed capacity from confirmed quotations
-            confirmed_quotations = partner.solar_quotation_ids.filtered(lambda q: q.state == 'confirmed')
-            partner.total_installed_capacity = sum(confirmed_quotations.mapped('system_power_kw'))
+                confirmed_quotations = partner.solar_quotation_ids.filtered(lambda q: q.state == 'confirmed')
+                partner.total_monthly_consumption = sum(partner.energy_meter_ids.mapped('average_monthly_consumption'))
+                partner.total_installed_capacity = sum(confirmed_quotations.mapped('system_power_kw'))
+
+    def _recompute_energy_stats(self):
+        """Recompute the energy statistics of the partners at once"""
+        fnames = [
+            'energy_meter_count', 'solar_quotation_count',
+            'total_monthly_consumption', 'total_installed_capacity',
+        ]
+        for fname in fnames:
+            self.env.add_to_compute(self._fields[fname], self)
+        self.flush_recordset(fnames)
 
     def action_view_energy_meters(self):
         """Smart button action to view energy meters"""
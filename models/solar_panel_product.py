@@ -2,10 +2,15 @@
 
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
+from odoo.tools import ormcache
+
+from ..lib import solar_kernel
+from ..lib.panel_matrix import PanelMatrix, panels_needed
 
 
 class SolarPanelProduct(models.Model):
     _name = 'sparks.solar.panel.product'
+    _inherit = ['sparks.cache.invalidation.mixin']
     _description = 'Solar Panel Product Catalog'
     _rec_name = 'display_name'
     _order = 'power_wp desc, efficiency desc'
@@ -204,12 +209,7 @@ class SolarPanelProduct(models.Model):
     def get_panels_needed_for_power(self, required_power_kw):
         """Calculate number of panels needed for required power"""
         self.ensure_one()
-        if self.power_wp <= 0:
-            return 0
-        
-        required_power_wp = required_power_kw * 1000
-        panels_needed = required_power_wp / self.power_wp
-        return int(panels_needed) + (1 if panels_needed % 1 > 0 else 0)  # Round up
+        return int(panels_needed(required_power_kw, self.power_wp))
 
     def get_total_area_for_panels(self, panel_quantity):
         """Calculate total area needed for given number of panels"""
@@ -221,65 +221,60 @@ class SolarPanelProduct(models.Model):
         self.ensure_one()
         return (panel_quantity * self.power_wp) / 1000  # Return in kW
 
-    @api.model
-    def get_best_panel_for_power(self, required_power_kw, application='all', preferred_only=False):
-        """Find the best panel for required power based on various criteria"""
-        domain = [('active', '=', True)]
-        
+    def _get_panel_spec(self):
+        """Kernel view of this panel"""
+        self.ensure_one()
+        return solar_kernel.PanelSpec(
+            id=self.id,
+            power_wp=self.power_wp,
+            efficiency=self.efficiency,
+            area_m2=self.area_m2,
+            unit_cost=self.unit_cost or 0.0,
+            technology=self.technology,
+            is_preferred=self.is_preferred,
+            application=self.application,
+        )
+
+    @ormcache('company_id')
+    def _get_panel_catalog(self, company_id):
+        """Cached kernel specs of the active panels available to a company, in catalog order"""
+        panels = self.sudo().search([('active', '=', True), ('company_id', 'in', [False, company_id])])
+        return tuple(panel._get_panel_spec() for panel in panels)
+
+    @ormcache('company_id', 'application', 'preferred_only')
+    def _get_panel_matrix(self, company_id, application, preferred_only):
+        """Cached feature matrix of the active panels available to a company
+
+        Panels of another company are left out, and so are panels for
+        another application unless ``application`` is 'all'.
+        """
+        domain = [('active', '=', True), ('company_id', 'in', [False, company_id])]
         if application != 'all':
             domain.append(('application', 'in', [application, 'all']))
-        
         if preferred_only:
             domain.append(('is_preferred', '=', True))
-        
-        # Get all suitable panels
-        panels = self.search(domain)
-        
-        if not panels:
-            return False
-        
-        # Score panels based on multiple criteria
-        panel_scores = []
-        for panel in panels:
-            panels_needed = panel.get_panels_needed_for_power(required_power_kw)
-            actual_power = panel.get_actual_power_for_panels(panels_needed)
-            total_area = panel.get_total_area_for_panels(panels_needed)
-            total_cost = panels_needed * (panel.unit_cost or 0)
-            
-            # Calculate score (higher is better)
-            score = 0
-            
-            # Prefer higher efficiency
-            score += panel.efficiency * 2
-            
-            # Prefer less area usage
-            if total_area > 0:
-                score += (1000 / total_area)  # Inverse of area
-            
-            # Prefer lower cost per kW
-            if total_cost > 0 and actual_power > 0:
-                cost_per_kw = total_cost / actual_power
-                score += (10000 / cost_per_kw)  # Inverse of cost per kW
-            
-            # Prefer preferred panels
-            if panel.is_preferred:
-                score += 50
-            
-            # Prefer newer technology
-            tech_bonus = {
-                'hjt': 30, 'topcon': 25, 'perc': 20, 'bifacial': 15,
-                'mono': 10, 'poly': 5, 'thin_film': 0
-            }
-            score += tech_bonus.get(panel.technology, 0)
-            
-            panel_scores.append((panel, score, panels_needed, actual_power, total_area))
-        
-        # Return best panel based on score
-        best_panel_data = max(panel_scores, key=lambda x: x[1])
-        return {
-            'panel': best_panel_data[0],
-            'panels_needed': best_panel_data[2],
-            'actual_power_kw': best_panel_data[3],
-            'total_area_m2': best_panel_data[4],
-            'score': best_panel_data[1]
-        }
+        panels = self.sudo().search(domain)
+        return PanelMatrix(panel._get_panel_spec() for panel in panels)
+
+    @api.model
+    def get_best_panels_for_powers(self, required_powers_kw, application='all', preferred_only=False, limit=1):
+        """Best ``limit`` panels for each of the required powers, scored at once
+
+        :return: one list per power of dicts like ``get_best_panel_for_power``'s,
+            best panel first
+        """
+        matrix = self._get_panel_matrix(self.env.company.id, application, bool(preferred_only))
+        return [[{
+            'panel': self.browse(panel_id),
+            'panels_needed': panels_needed,
+            'actual_power_kw': actual_power_kw,
+            'total_area_m2': total_area_m2,
+            'score': score,
+        } for panel_id, score, panels_needed, actual_power_kw, total_area_m2 in top]
+            for top in matrix.top(required_powers_kw, limit)]
+
+    @api.model
+    def get_best_panel_for_power(self, required_power_kw, application='all', preferred_only=False):
+        """Find the best panel for required power based on various criteria"""
+        best = self.get_best_panels_for_powers([required_power_kw], application, preferred_only)[0]
+        return best[0] if best else False
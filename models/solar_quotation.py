@@ -1,11 +1,41 @@
 # -*- coding: utf-8 -*-
 
+import dataclasses
+import math
+
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
+from odoo.osv import expression
+from odoo.tools import str2bool
 import logging
 
+from ..lib import quotation_engine, sizing_optimizer, solar_kernel
+
 _logger = logging.getLogger(__name__)
 
+# Stored fields produced by the calculation engine
+CALCULATION_FIELDS = [
+    'total_annual_consumption', 'average_monthly_consumption', 'peak_monthly_consumption',
+    'system_power_kw', 'panel_quantity', 'actual_system_power_kw', 'total_panel_area_m2',
+    'estimated_annual_production', 'coverage_percentage',
+    'monthly_balance', 'annual_self_consumption', 'annual_surplus', 'annual_deficit',
+    'subtotal_investment', 'tax_amount', 'total_investment',
+    'monthly_savings', 'payback_period_years', *quotation_engine.CASH_FLOW_FIELDS,
+]
+
+# Fields of _compute_financial_data and _compute_cash_flow, which read kit
+# costs and price projections
+FINANCIAL_FIELDS = [
+    'subtotal_investment', 'tax_amount', 'total_investment',
+    'monthly_savings', 'payback_period_years', *quotation_engine.CASH_FLOW_FIELDS,
+]
+
+# Quotations still open to repricing
+REPRICING_STATES = ('draft', 'calculated')
+
+# Above this many quotations, repricing is handed to a background job
+REPRICING_JOB_THRESHOLD = 5000
+
 _logger.info("=== LOADING SPARKS QUOTATION ===")
 
 class SolarQuotation(models.Model):
@@ -137,6 +167,30 @@ class SolarQuotation(models.Model):
         store=True
     )
     
+    # Cash flow over the panel warranty
+    net_present_value = fields.Monetary(
+        string='Net Present Value',
+        compute='_compute_cash_flow',
+        store=True,
+        currency_field='currency_id'
+    )
+    internal_rate_of_return = fields.Float(
+        string='Internal Rate of Return (%)',
+        compute='_compute_cash_flow',
+        store=True
+    )
+    levelized_cost_of_energy = fields.Float(
+        string='Levelized Cost of Energy (per kWh)',
+        compute='_compute_cash_flow',
+        store=True,
+        digits=(16, 4)
+    )
+    discounted_payback_years = fields.Float(
+        string='Discounted Payback (Years)',
+        compute='_compute_cash_flow',
+        store=True
+    )
+    
     # Computed consumption data
     total_annual_consumption = fields.Float(
         string='Annual Consumption (kWh)',
@@ -166,6 +220,33 @@ class SolarQuotation(models.Model):
         store=True
     )
     
+    # Monthly energy balance
+    monthly_balance = fields.Json(
+        string='Monthly Energy Balance',
+        compute='_compute_energy_balance',
+        store=True,
+        help="Production, consumption, self-consumption, surplus, deficit (kWh) "
+             "and coverage (%) of each month, as lists of 12 values"
+    )
+    annual_self_consumption = fields.Float(
+        string='Self-Consumed Production (kWh)',
+        compute='_compute_energy_balance',
+        store=True,
+        help="Production consumed in the month it is produced"
+    )
+    annual_surplus = fields.Float(
+        string='Annual Surplus (kWh)',
+        compute='_compute_energy_balance',
+        store=True,
+        help="Production exceeding the consumption of its month"
+    )
+    annual_deficit = fields.Float(
+        string='Annual Deficit (kWh)',
+        compute='_compute_energy_balance',
+        store=True,
+        help="Consumption not covered by the production of its month"
+    )
+    
     # Solar radiation field
     annual_solar_radiation = fields.Float(
         string='Annual Solar Radiation (kWh/m²)',
@@ -208,11 +289,12 @@ class SolarQuotation(models.Model):
     description = fields.Html(string='Description')
     terms_conditions = fields.Html(string='Terms and Conditions')
 
-    @api.model
-    def create(self, vals):
-        if vals.get('name', _('New')) == _('New'):
-            vals['name'] = self.env['ir.sequence'].next_by_code('sparks.solar.quotation') or _('New')
-        return super().create(vals)
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            if vals.get('name', _('New')) == _('New'):
+                vals['name'] = self.env['ir.sequence'].next_by_code('sparks.solar.quotation') or _('New')
+        return super().create(vals_list)
 
     @api.depends('meter_ids')
     def _compute_meter_count(self):
@@ -273,34 +355,16 @@ class SolarQuotation(models.Model):
             # Clear existing consumption lines
             self.consumption_line_ids = [(5, 0, 0)]
             
-            # Aggregate consumption data from all selected meters
-            consumption_by_month = {}
-            
-            for meter in self.meter_ids:
-                # Get latest 12 months of consumption for each meter
-                latest_consumptions = meter.consumption_line_ids.sorted('year desc, month desc')[:12]
-                
-                for consumption in latest_consumptions:
-                    month_key = consumption.month
-                    if month_key not in consumption_by_month:
-                        consumption_by_month[month_key] = {
-                            'energy_kwh': 0,
-                            'energy_cost': 0,
-                        }
-                    
-                    consumption_by_month[month_key]['energy_kwh'] += consumption.energy_kwh
-                    consumption_by_month[month_key]['energy_cost'] += (consumption.energy_cost or 0)
+            # Aggregate the latest 12 months of all selected meters in one query
+            monthly_totals = self.meter_ids._origin._read_recent_monthly_consumption()
             
             # Create consumption lines with aggregated data
-            if consumption_by_month:
-                consumption_lines = []
-                for month, data in consumption_by_month.items():
-                    consumption_lines.append((0, 0, {
-                        'month': str(month),
-                        'energy_kwh': data['energy_kwh'],
-                        'energy_cost': data['energy_cost'],
-                    }))
-                self.consumption_line_ids = consumption_lines
+            if monthly_totals:
+                self.consumption_line_ids = [(0, 0, {
+                    'month': month,
+                    'energy_kwh': energy_kwh,
+                    'energy_cost': energy_cost,
+                }) for month, energy_kwh, energy_cost in monthly_totals]
 
     @api.depends('consumption_line_ids.energy_kwh')
     def _compute_consumption_data(self):
@@ -317,113 +381,273 @@ class SolarQuotation(models.Model):
 
     @api.depends('total_annual_consumption', 'city_id', 'system_efficiency', 'panel_power_wp')
     def _compute_system_specifications(self):
-        for record in self:
-            if record.total_annual_consumption and record.city_id:
-                # Calculate required system power based on consumption and solar radiation
-                annual_radiation = record.city_id.total_radiation_adjusted or record.city_id.total_radiation
-                if annual_radiation > 0:
-                    # System power calculation considering efficiency losses
-                    efficiency_factor = record.system_efficiency / 100.0
-                    record.system_power_kw = (
-                        record.total_annual_consumption / 
-                        (annual_radiation * efficiency_factor)
-                    )
-                    
-                    # Calculate number of panels and actual system power
-                    if record.selected_panel_id and record.panel_power_wp > 0:
-                        record.panel_quantity = int(
-                            (record.system_power_kw * 1000) / record.panel_power_wp
-                        ) + 1  # Round up
-                        
-                        # Calculate actual system power based on panel quantity
-                        record.actual_system_power_kw = (record.panel_quantity * record.panel_power_wp) / 1000
-                        
-                        # Calculate total panel area
-                        record.total_panel_area_m2 = record.panel_quantity * (record.panel_area_m2 or 0)
-                    else:
-                        record.panel_quantity = 0
-                        record.actual_system_power_kw = record.system_power_kw
-                        record.total_panel_area_m2 = 0.0
-                else:
-                    record.system_power_kw = 0.0
-                    record.panel_quantity = 0
-                    record.actual_system_power_kw = 0.0
-                    record.total_panel_area_m2 = 0.0
-            else:
-                record.system_power_kw = 0.0
-                record.panel_quantity = 0
-                record.actual_system_power_kw = 0.0
-                record.total_panel_area_m2 = 0.0
+        results = quotation_engine.size_systems(
+            self.mapped('total_annual_consumption'),
+            self._get_engine_radiation(),
+            self.mapped('system_efficiency'),
+            self.mapped('panel_power_wp'),
+            self.mapped('panel_area_m2'),
+        )
+        self._assign_engine_results(results)
 
     @api.depends('actual_system_power_kw', 'city_id', 'system_efficiency')
     def _compute_energy_production(self):
+        results = quotation_engine.estimate_production(
+            self.mapped('actual_system_power_kw'),
+            self._get_engine_radiation(),
+            self.mapped('system_efficiency'),
+            self.mapped('total_annual_consumption'),
+        )
+        self._assign_engine_results(results)
+
+    @api.depends('estimated_annual_production', 'consumption_line_ids.energy_kwh',
+                 'consumption_line_ids.month', 'city_id')
+    def _compute_energy_balance(self):
+        radiation = self.env['sparks.solar.radiation']
+        consumption = []
         for record in self:
-            if record.actual_system_power_kw and record.city_id:
-                annual_radiation = record.city_id.total_radiation_adjusted or record.city_id.total_radiation
-                efficiency_factor = record.system_efficiency / 100.0
-                
-                record.estimated_annual_production = (
-                    record.actual_system_power_kw * annual_radiation * efficiency_factor
-                )
-                
-                if record.total_annual_consumption > 0:
-                    record.coverage_percentage = min(
-                        (record.estimated_annual_production / record.total_annual_consumption) * 100,
-                        100.0
-                    )
-                else:
-                    record.coverage_percentage = 0.0
-            else:
-                record.estimated_annual_production = 0.0
-                record.coverage_percentage = 0.0
+            months = [0.0] * 12
+            for line in record.consumption_line_ids:
+                if line.month:
+                    months[int(line.month) - 1] += line.energy_kwh
+            consumption.append(months)
+        balance = quotation_engine.monthly_balance(
+            self.mapped('estimated_annual_production'),
+            [radiation._get_monthly_radiation(record.city_id._origin.id) for record in self],
+            consumption,
+        )
+        series = {name: values.round(2).tolist() for name, values in balance.items()}
+        annual = {name: balance[name].sum(axis=1).tolist() for name in ('self_consumption', 'surplus', 'deficit')}
+        for index, record in enumerate(self):
+            record.monthly_balance = {name: values[index] for name, values in series.items()}
+            record.annual_self_consumption = annual['self_consumption'][index]
+            record.annual_surplus = annual['surplus'][index]
+            record.annual_deficit = annual['deficit'][index]
 
     @api.depends('actual_system_power_kw', 'estimated_annual_production', 'tax_rate')
     def _compute_financial_data(self):
-        for record in self:
-            if record.actual_system_power_kw:
-                # Get cost per kW from solar kit data (simplified)
-                cost_per_kw = 1200.0  # Default cost per kW USD
-                solar_kit = self.env['sparks.solar.kit.detail'].search([
-                    ('power_capacity_id.power', '>=', record.actual_system_power_kw)
-                ], limit=1, order='power_capacity_id.power asc')
-                
-                if solar_kit:
-                    cost_per_kw = solar_kit.cost_per_kw
-                
-                # Calculate subtotal and total with taxes
-                record.subtotal_investment = record.actual_system_power_kw * cost_per_kw
-                record.tax_amount = record.subtotal_investment * (record.tax_rate / 100)
-                record.total_investment = record.subtotal_investment + record.tax_amount
-                
-                # Calculate monthly savings based on energy production
-                if record.estimated_annual_production:
-                    # Get current energy price
-                    current_year = fields.Date.today().year
-                    energy_price = self.env['sparks.energy.projection'].search([
-                        ('name', '=', str(current_year))
-                    ], limit=1)
-                    
-                    if energy_price:
-                        annual_savings = record.estimated_annual_production * energy_price.projected_price
-                        record.monthly_savings = annual_savings / 12
-                        
-                        # Calculate payback period
-                        if record.monthly_savings > 0:
-                            record.payback_period_years = record.total_investment / (record.monthly_savings * 12)
-                        else:
-                            record.payback_period_years = 0.0
-                    else:
-                        record.monthly_savings = 0.0
-                        record.payback_period_years = 0.0
-                else:
-                    record.monthly_savings = 0.0
-                    record.payback_period_years = 0.0
-            else:
-                record.subtotal_investment = 0.0
-                record.tax_amount = 0.0
-                record.total_investment = 0.0
-                record.monthly_savings = 0.0
-                record.payback_period_years = 0.0
+        actual_power = self.mapped('actual_system_power_kw')
+        results = quotation_engine.compute_financials(
+            actual_power,
+            self.mapped('estimated_annual_production'),
+            self.mapped('tax_rate'),
+            self._get_kit_cost_per_kw(actual_power),
+            self._get_current_energy_price(),
+        )
+        self._assign_engine_results(results)
+
+    @api.depends('total_investment', 'estimated_annual_production', 'selected_panel_id.warranty_years')
+    def _compute_cash_flow(self):
+        assumptions = self._get_cash_flow_assumptions()
+        horizons = [
+            record.selected_panel_id.warranty_years or assumptions.horizon_years
+            for record in self
+        ]
+        results = quotation_engine.simulate_cash_flows(
+            self.mapped('total_investment'),
+            self.mapped('estimated_annual_production'),
+            horizons,
+            self.env['sparks.energy.projection']._get_price_path(
+                fields.Date.today().year, max(horizons, default=0)),
+            assumptions,
+        )
+        self._assign_engine_results(results)
+
+    # -------------------------------------------------------------------------
+    # Batch calculation engine helpers
+    # -------------------------------------------------------------------------
+
+    def _get_engine_radiation(self):
+        """Annual radiation per quotation, adjusted value first (0 without city)"""
+        radiation = self.env['sparks.solar.radiation']
+        return [radiation._get_annual_radiation(record.city_id._origin.id) for record in self]
+
+    @api.model
+    def _get_kit_cost_per_kw(self, actual_power):
+        """Cost per kW for each system power, looked up in the cached kit index
+
+        Set the ``sparks.kit_cost_interpolation`` system parameter to True
+        to interpolate linearly between kit capacities.
+        """
+        index = self.env['sparks.solar.kit.reference']._get_cost_index()
+        return quotation_engine.lookup_cost_per_kw(
+            actual_power, index.capacities, index.costs,
+            interpolate=self._use_kit_cost_interpolation())
+
+    @api.model
+    def _use_kit_cost_interpolation(self):
+        return str2bool(self.env['ir.config_parameter'].sudo().get_param(
+            'sparks.kit_cost_interpolation') or '', False)
+
+    @api.model
+    def _get_cash_flow_assumptions(self):
+        """Cash flow assumptions, each overridable by a ``sparks.<name>`` system parameter
+
+        Parameters are read as numbers, rounded for the integer assumptions
+        ("12.0" is 12 years); a value that is not a number is logged and
+        the default is kept.
+        """
+        config = self.env['ir.config_parameter'].sudo()
+        defaults = solar_kernel.CashFlowAssumptions()
+        values = {}
+        for field in dataclasses.fields(defaults):
+            key = 'sparks.%s' % field.name
+            value = config.get_param(key)
+            if not value:
+                continue
+            try:
+                number = float(value)
+            except ValueError:
+                number = math.nan
+            if not math.isfinite(number):
+                _logger.warning("Ignoring system parameter %s: %r is not a number", key, value)
+                continue
+            default = getattr(defaults, field.name)
+            values[field.name] = round(number) if isinstance(default, int) else number
+        return dataclasses.replace(defaults, **values)
+
+    @api.model
+    def _get_current_energy_price(self):
+        """Projected price for the current year, None when no projection exists"""
+        current_year = fields.Date.today().year
+        return self.env['sparks.energy.projection']._get_projected_price(current_year)
+
+    @api.model
+    def simulate_quotation(self, annual_consumption_kwh, city_id=False, panel_id=False,
+                           system_efficiency=85.0, tax_rate=12.0):
+        """What-if calculation through the quotation engine, without creating records
+
+        Returns the values the quotation fields would take, as a dict.
+        """
+        panel = self.env['sparks.solar.panel.product'].browse(panel_id)
+        inputs = solar_kernel.QuotationInput(
+            annual_consumption_kwh=annual_consumption_kwh,
+            annual_radiation=self.env['sparks.solar.radiation']._get_annual_radiation(city_id),
+            system_efficiency=system_efficiency,
+            panel_power_wp=panel.power_wp if panel else 0.0,
+            panel_area_m2=panel.area_m2 if panel else 0.0,
+            tax_rate=tax_rate,
+        )
+        [result] = quotation_engine.calculate_batch(
+            [inputs],
+            cost_index=self.env['sparks.solar.kit.reference']._get_cost_index(),
+            energy_price=self._get_current_energy_price(),
+            interpolate=self._use_kit_cost_interpolation(),
+        )
+        return result.as_dict()
+
+    def get_sizing_options(self, max_area_m2=None, min_coverage=0.0, max_budget=None):
+        """Pareto optimal sizes of this system over the active panel catalog
+
+        Each option is a panel, a quantity and the kit capacity it is priced
+        with, none being better on cost, coverage and area at once.  The
+        constraints are the roof area (m²), the minimum coverage (%) and the
+        budget, taxes included.
+
+        :return: list of dicts, cheapest option first
+        """
+        self.ensure_one()
+        options = sizing_optimizer.optimize_sizing(
+            self.env['sparks.solar.panel.product']._get_panel_catalog(
+                self.company_id.id or self.env.company.id),
+            self.total_annual_consumption,
+            self._get_engine_radiation()[0],
+            self.env['sparks.solar.kit.reference']._get_cost_index(),
+            system_efficiency=self.system_efficiency,
+            tax_rate=self.tax_rate,
+            max_area_m2=max_area_m2,
+            min_coverage=min_coverage,
+            max_budget=max_budget,
+        )
+        return [dataclasses.asdict(option) for option in options]
+
+    def _assign_engine_results(self, results):
+        """Write engine result arrays back onto the records, in order"""
+        names = list(results)
+        columns = [results[name].tolist() for name in names]
+        for record, row in zip(self, zip(*columns)):
+            record.update(dict(zip(names, row)))
+
+    def _recompute_system_calculations(self, batch_size=1000):
+        """Recompute consumption, sizing, production and financial figures"""
+        self._recompute_in_batches(CALCULATION_FIELDS, batch_size)
+
+    def _recompute_financial_data(self, batch_size=1000):
+        """Recompute the financial figures only"""
+        self._recompute_in_batches(FINANCIAL_FIELDS, batch_size)
+
+    def _recompute_in_batches(self, fnames, batch_size=1000):
+        """Recompute stored fields in batches
+
+        Every field is marked to compute for the batch and flushed at once,
+        so each compute method runs a single time over the whole batch.
+        """
+        fields_to_compute = [self._fields[name] for name in fnames]
+        for start in range(0, len(self), batch_size):
+            batch = self[start:start + batch_size]
+            for field in fields_to_compute:
+                self.env.add_to_compute(field, batch)
+            batch.flush_recordset(fnames)
+            if len(self) > batch_size:
+                batch.invalidate_recordset()
+
+    # -------------------------------------------------------------------------
+    # Pricing change propagation
+    # -------------------------------------------------------------------------
+
+    @api.model
+    def _propagate_pricing_change(self, power_ranges=(), price_changed=False):
+        """Recompute the financial figures of the open quotations a pricing change affects
+
+        ``power_ranges`` are the ``(low, high]`` system powers whose kit cost
+        changed (see ``KitCostIndex.changed_ranges``); ``price_changed`` means
+        the energy price projections changed, which affects every quotation
+        with some production.
+        """
+        domains = []
+        if price_changed:
+            domains.append([('estimated_annual_production', '!=', 0)])
+        for low, high in power_ranges:
+            domain = [('actual_system_power_kw', '>', low or 0)]
+            if high is not None:
+                domain.append(('actual_system_power_kw', '<=', high))
+            domains.append(domain)
+        if not domains:
+            return self.browse()
+
+        quotations = self.sudo().search(expression.AND([
+            [('state', 'in', REPRICING_STATES)],
+            expression.OR(domains),
+        ]))
+        if len(quotations) > REPRICING_JOB_THRESHOLD:
+            # Same repricing as below, skipping the quotations closed meanwhile
+            self.env['sparks.recompute.job']._enqueue(
+                quotations,
+                name=_("Quotation repricing"),
+                domain=[('state', 'in', REPRICING_STATES)],
+                method='_recompute_financial_data',
+            )
+        elif quotations:
+            _logger.info("Repricing %d solar quotations", len(quotations))
+            quotations._recompute_financial_data()
+        return quotations
+
+    @api.model
+    def _cron_propagate_pricing_year(self):
+        """Reprice open quotations when the calendar year rolls over"""
+        config = self.env['ir.config_parameter'].sudo()
+        current_year = fields.Date.today().year
+        pricing_year = int(config.get_param('sparks.pricing_year', 0) or 0)
+        if pricing_year == current_year:
+            return
+
+        if pricing_year:
+            Reference = self.env['sparks.solar.kit.reference']
+            power_ranges = Reference._get_cost_index(pricing_year).changed_ranges(
+                Reference._get_cost_index(current_year), self._use_kit_cost_interpolation())
+            # Cash flows start with the current year's price: they all shift
+            self._propagate_pricing_change(power_ranges, price_changed=True)
+        config.set_param('sparks.pricing_year', current_year)
 
     def action_calculate_system(self):
         """Recalculate system specifications"""
@@ -432,10 +656,7 @@ class SolarQuotation(models.Model):
             raise ValidationError(_("Please add monthly consumption data before calculating the system."))
         
         # Trigger recalculation
-        self._compute_consumption_data()
-        self._compute_system_specifications()
-        self._compute_energy_production()
-        self._compute_financial_data()
+        self._recompute_system_calculations()
         
         self.state = 'calculated'
         
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+from . import test_performance
+from . import test_pricing_propagation
+from . import test_energy_meter
+from . import test_meter_import
+from . import test_cash_flow
+from . import test_recompute_job
+from . import test_consumption_import
+from . import test_month_parser
+from . import test_spreadsheet_reader
+from . import test_quotation_engine
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+import base64
+import logging
+import time
+from contextlib import contextmanager
+
+from odoo.tests import TransactionCase
+
+_logger = logging.getLogger(__name__)
+
+# Context used to build datasets without chatter noise
+NO_TRACKING = {
+    'tracking_disable': True,
+    'mail_create_nolog': True,
+    'mail_notrack': True,
+}
+
+
+class SparksDatasetCase(TransactionCase):
+    """Builds a synthetic dataset of partners, meters, bills and quotations
+
+    ``METER_COUNT`` meters are spread over partners of ``METERS_PER_PARTNER``
+    meters each, every meter gets ``HISTORY_YEARS`` years of monthly
+    ``sparks.meter.consumption`` and every partner one quotation with its
+    12 ``sparks.consumption.line`` rows.
+    """
+
+    METER_COUNT = 1000
+    METERS_PER_PARTNER = 10
+    HISTORY_YEARS = 3
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env = cls.env(context=dict(cls.env.context, **NO_TRACKING))
+        cls._create_master_data()
+        cls._create_partners_and_meters()
+        cls._create_meter_history()
+        cls._create_quotations()
+
+    @classmethod
+    def _create_master_data(cls):
+        env = cls.env
+        cls.current_year = time.localtime().tm_year
+        cls.projection = env['sparks.energy.projection'].create([{
+            'name': str(year),
+            'actual_price': 0.12,
+            'projected_price': 0.12 + 0.005 * (year - cls.current_year),
+            'inflation_rate': 3.5,
+        } for year in range(cls.current_year - cls.HISTORY_YEARS, cls.current_year + 26)])
+        current_projection = cls.projection.filtered(lambda p: p.name == str(cls.current_year))
+
+        cls.city = env['sparks.solar.radiation'].create({
+            'name': 'Portoviejo',
+            'year': current_projection.id,
+            'country_id': env.ref('base.ec').id,
+            'city': 'Portoviejo',
+        })
+        cls.panel = env['sparks.solar.panel.product'].create({
+            'name': 'PERF-550',
+            'manufacturer': 'Benchmark Solar',
+            'power_wp': 550.0,
+            'efficiency': 21.3,
+            'length_mm': 2278.0,
+            'width_mm': 1134.0,
+            'unit_cost': 180.0,
+            'technology': 'mono',
+        })
+        capacities = env['sparks.solar.kit.capacity'].create([
+            {'name': '%s kW' % power, 'power': power} for power in (3, 5, 10, 20, 50, 100)
+        ])
+        env['sparks.solar.kit.reference'].create({
+            'name': 'Benchmark costs',
+            'year': current_projection.id,
+            'detail_line_ids': [(0, 0, {
+                'power_capacity_id': capacity.id,
+                'equipment_cost': capacity.power * 800.0,
+                'installation_cost': capacity.power * 200.0,
+            }) for capacity in capacities],
+        })
+
+    @classmethod
+    def _create_partners_and_meters(cls):
+        env = cls.env
+        partner_count = max(cls.METER_COUNT // cls.METERS_PER_PARTNER, 1)
+        cls.partners = env['res.partner'].create([
+            {'name': 'Perf Customer %d' % index} for index in range(partner_count)
+        ])
+        cls.meters = env['sparks.energy.meter'].create([{
+            'name': 'PERF-%06d' % index,
+            'supply_number': 'SN-PERF-%06d' % index,
+            'partner_id': cls.partners[index % partner_count].id,
+            'city_id': cls.city.id,
+            'meter_type': ('residential', 'commercial', 'industrial')[index % 3],
+        } for index in range(cls.METER_COUNT)])
+
+    @classmethod
+    def _create_meter_history(cls):
+        # Bills are generated in SQL: going through the ORM would dominate
+        # the setup time of the larger datasets.
+        env = cls.env
+        env.flush_all()
+        env.cr.execute("""
+            INSERT INTO sparks_meter_consumption
+                (meter_id, year, month, year_month, energy_kwh, energy_cost, currency_id,
+                 create_uid, write_uid, create_date, write_date)
+            SELECT meter.id, bill_year, bill_month::varchar,
+                   bill_year || '-' || lpad(bill_month::text, 2, '0'),
+                   150 + (meter.id %% 40) * 12.5 + bill_month * 7,
+                   (150 + (meter.id %% 40) * 12.5 + bill_month * 7) * 0.12,
+                   %(currency)s, %(uid)s, %(uid)s, now(), now()
+              FROM sparks_energy_meter meter,
+                   generate_series(%(first_year)s, %(last_year)s) bill_year,
+                   generate_series(1, 12) bill_month
+             WHERE meter.id IN %(meter_ids)s
+        """, {
+            'currency': env.company.currency_id.id,
+            'uid': env.uid,
+            'first_year': cls.current_year - cls.HISTORY_YEARS,
+            'last_year': cls.current_year - 1,
+            'meter_ids': tuple(cls.meters.ids),
+        })
+        env.invalidate_all()
+        cls._recompute_meter_stats(cls.meters)
+
+    @classmethod
+    def _create_quotations(cls):
+        env = cls.env
+        Quotation = env['sparks.solar.quotation']
+        meter_ids_by_partner = {}
+        for meter in cls.meters:
+            meter_ids_by_partner.setdefault(meter.partner_id.id, []).append(meter.id)
+        quotations = Quotation
+        for partner in cls.partners:
+            quotations |= Quotation.create({
+                'partner_id': partner.id,
+                'city_id': cls.city.id,
+                'selected_panel_id': cls.panel.id,
+                'meter_ids': [(6, 0, meter_ids_by_partner.get(partner.id, []))],
+                'consumption_line_ids': cls._consumption_line_commands(),
+            })
+        cls.quotations = quotations
+
+    def _partner_meters(self, partner):
+        return self.meters.filtered(lambda meter: meter.partner_id == partner)
+
+    @classmethod
+    def _consumption_line_commands(cls, base_kwh=450.0):
+        return [(0, 0, {
+            'month': str(month),
+            'energy_kwh': base_kwh + month * 10,
+            'energy_cost': (base_kwh + month * 10) * 0.12,
+        }) for month in range(1, 13)]
+
+    @classmethod
+    def _recompute_meter_stats(cls, meters):
+        meters._recompute_consumption_stats()
+
+    @contextmanager
+    def assertBudget(self, operation, budget, record_count=None):
+        """Assert the query budget of a block and log its wall time"""
+        self.env.flush_all()
+        self.env.invalidate_all()
+        start = time.perf_counter()
+        with self.assertQueryCount(budget):
+            yield
+            self.env.flush_all()
+        elapsed = time.perf_counter() - start
+        _logger.info(
+            "sparks perf [%d meters] %s: %.3fs%s", self.METER_COUNT, operation, elapsed,
+            " (%d records, %.0f records/s)" % (record_count, record_count / elapsed)
+            if record_count and elapsed else "",
+        )
+
+    def _csv_file(self, rows):
+        lines = ['month,consumption,cost'] + ['%s,%s,%s' % row for row in rows]
+        return base64.b64encode('\n'.join(lines).encode())
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests import BaseCase, TransactionCase, tagged
+
+from ..lib import quotation_engine, solar_kernel
+from ..models import solar_quotation
+
+
+@tagged('post_install', '-at_install')
+class TestCashFlowSimulation(BaseCase):
+    """Cash flow results of one case computed by hand"""
+
+    def test_two_year_case(self):
+        # 1900 kWh a year sold at 0.5, minus 5 % of the investment for O&M:
+        # 900 a year, which a rate of 50 % discounts to exactly 1000.
+        assumptions = solar_kernel.CashFlowAssumptions(
+            discount_rate=10.0,
+            degradation_rate=0.0,
+            om_cost_rate=5.0,
+            om_escalation_rate=0.0,
+            inverter_replacement_year=2,  # Not replaced in the last year
+            inverter_cost_rate=10.0,
+            horizon_years=2,
+        )
+        results = quotation_engine.simulate_cash_flows([1000.0], [1900.0], [2], [0.5, 0.5], assumptions)
+
+        # 900 / 1.1 + 900 / 1.21 - 1000
+        self.assertAlmostEqual(results['net_present_value'][0], 1890 / 1.21 - 1000)
+        self.assertAlmostEqual(results['internal_rate_of_return'][0], 50.0)
+        # (1000 + 50 / 1.1 + 50 / 1.21) / (1900 / 1.1 + 1900 / 1.21)
+        self.assertAlmostEqual(results['levelized_cost_of_energy'][0], 1315 / 3990)
+        # 181.82 left after the first year, recovered from 743.80 in the second
+        self.assertAlmostEqual(results['discounted_payback_years'][0], 1 + 242 / 990)
+
+
+@tagged('post_install', '-at_install')
+class TestCashFlowAssumptions(TransactionCase):
+    """System parameters overriding the cash flow assumptions"""
+
+    def _assumptions(self, **params):
+        config = self.env['ir.config_parameter'].sudo()
+        for name, value in params.items():
+            config.set_param('sparks.%s' % name, value)
+        return self.env['sparks.solar.quotation']._get_cash_flow_assumptions()
+
+    def test_numbers(self):
+        assumptions = self._assumptions(inverter_replacement_year='12.0', horizon_years=' 20', discount_rate='6')
+        self.assertEqual(assumptions.inverter_replacement_year, 12)
+        self.assertIsInstance(assumptions.inverter_replacement_year, int)
+        self.assertEqual(assumptions.horizon_years, 20)
+        self.assertEqual(assumptions.discount_rate, 6.0)
+
+    def test_invalid_values_keep_the_defaults(self):
+        defaults = solar_kernel.CashFlowAssumptions()
+        with self.assertLogs(solar_quotation._logger.name, 'WARNING'):
+            assumptions = self._assumptions(horizon_years='twenty', discount_rate='nan')
+        self.assertEqual(assumptions.horizon_years, defaults.horizon_years)
+        self.assertEqual(assumptions.discount_rate, defaults.discount_rate)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+from unittest.mock import patch
+
+from odoo.tests import tagged
+
+from ..wizards import import_consumption_wizard
+from .common import SparksDatasetCase
+
+
+@tagged('post_install', '-at_install')
+class TestConsumptionImportCache(SparksDatasetCase):
+    """Rows parsed by the preview step and reused by the import"""
+
+    METER_COUNT = 6
+    METERS_PER_PARTNER = 3
+
+    def setUp(self):
+        super().setUp()
+        self.patch(import_consumption_wizard, '_previews', import_consumption_wizard.LRU(32))
+        self.patch(import_consumption_wizard, '_parsed_rows', import_consumption_wizard.LRU(32))
+
+    def _wizard(self, rows):
+        return self.env['sparks.import.consumption.wizard'].create({
+            'quotation_id': self.quotations[0].id,
+            'import_file': self._csv_file(rows),
+            'filename': 'bills.csv',
+            'file_type': 'csv',
+        })
+
+    def test_import_reuses_the_preview_parse(self):
+        rows = [(month, 500 + month, 60 + month) for month in range(1, 13)]
+        wizard = self._wizard(rows)
+        Wizard = type(wizard)
+        with patch.object(Wizard, '_parse_file', autospec=True, side_effect=Wizard._parse_file) as parse:
+            wizard.action_preview()
+            self.assertIn('12 rows to import', wizard.preview_data)
+            wizard.action_import()
+            self.assertEqual(parse.call_count, 1)
+
+            # Another mapping of the same content is parsed again
+            wizard.cost_column = 4  # No cost column
+            wizard.action_import()
+            self.assertEqual(parse.call_count, 2)
+        self.assertEqual(self.quotations[0].consumption_line_ids.mapped('energy_cost'), [0.0] * 12)
+
+    def test_vacuum_evicts_the_rows(self):
+        wizard = self._wizard([(1, 500, 60)])
+        wizard.action_preview()
+        key = wizard._get_rows_cache_key()
+        self.assertIn(key, import_consumption_wizard._parsed_rows)
+        wizard.unlink()
+        self.assertNotIn(key, import_consumption_wizard._parsed_rows)
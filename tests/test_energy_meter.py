@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+from odoo.exceptions import ValidationError
+from odoo.tests import TransactionCase, tagged
+
+from .common import SparksDatasetCase
+
+
+@tagged('post_install', '-at_install')
+class TestMeterConsumptionStats(SparksDatasetCase):
+    """Running consumption statistics against a full recompute"""
+
+    METER_COUNT = 6
+    METERS_PER_PARTNER = 3
+
+    def assertStatsMatchRecompute(self, meters):
+        self.env.flush_all()
+        expected = meters._read_consumption_stats()
+        for meter in meters:
+            count, total, peak, last_12_months = expected.get(meter.id, (0, 0.0, 0.0, 0.0))
+            self.assertEqual(meter.consumption_bill_count, count)
+            self.assertAlmostEqual(meter.total_annual_consumption, total or 0.0)
+            self.assertAlmostEqual(meter.average_monthly_consumption, total / count if count else 0.0)
+            self.assertAlmostEqual(meter.peak_monthly_consumption, peak or 0.0)
+            self.assertAlmostEqual(meter.last_12_months_consumption, last_12_months or 0.0)
+
+    def test_create(self):
+        self.env['sparks.meter.consumption'].create([{
+            'meter_id': meter.id,
+            'year': self.current_year,
+            'month': str(month),
+            'energy_kwh': 5000.0 if month == 2 else 100.0,
+        } for meter in self.meters[:2] for month in (1, 2, 3)])
+        self.assertEqual(self.meters[0].peak_monthly_consumption, 5000.0)
+        self.assertStatsMatchRecompute(self.meters)
+
+    def test_write(self):
+        meter = self.meters[0]
+        bills = meter.consumption_line_ids
+        peak_bills = bills.filtered(lambda bill: bill.energy_kwh == meter.peak_monthly_consumption)
+
+        bills[0].energy_kwh += 300.0  # Most recent bill, new peak
+        self.assertStatsMatchRecompute(meter)
+        bills[0].energy_kwh = 10.0  # Peak lost
+        peak_bills.energy_kwh = 20.0
+        self.assertStatsMatchRecompute(meter)
+        bills[1].meter_id = self.meters[1]
+        self.assertStatsMatchRecompute(self.meters[:2])
+
+    def test_unlink(self):
+        meter = self.meters[0]
+        meter.consumption_line_ids.sorted('energy_kwh')[-1].unlink()
+        meter.consumption_line_ids.sorted('year_month')[-1].unlink()
+        self.meters[1].consumption_line_ids.unlink()
+        self.assertStatsMatchRecompute(self.meters[:2])
+        self.assertEqual(self.meters[1].consumption_bill_count, 0)
+
+    def test_cron_repairs_drift(self):
+        meter = self.meters[0]
+        self.env.flush_all()
+        self.env.cr.execute("""
+            UPDATE sparks_energy_meter
+               SET peak_monthly_consumption = 1, consumption_bill_count = 1
+             WHERE id = %s
+        """, [meter.id])
+        meter.invalidate_recordset()
+
+        drifted = self.env['sparks.energy.meter']._cron_verify_consumption_stats(batch_size=4)
+        self.assertEqual(drifted & self.meters, meter)
+        self.assertStatsMatchRecompute(self.meters)
+        self.assertFalse(self.env['sparks.energy.meter']._cron_verify_consumption_stats())
+
+    def test_init_backfills_existing_meters(self):
+        # Meters billed before the statistics were maintained incrementally
+        self.env.flush_all()
+        self.env.cr.execute("""
+            UPDATE sparks_energy_meter
+               SET consumption_bill_count = NULL, last_12_months_consumption = NULL
+             WHERE id = ANY(%s)
+        """, [self.meters[:2].ids])
+        self.meters.invalidate_recordset()
+
+        self.env['sparks.meter.consumption'].init()
+        self.assertEqual(self.meters[0].consumption_bill_count, len(self.meters[0].consumption_line_ids))
+        self.assertStatsMatchRecompute(self.meters)
+
+
+@tagged('post_install', '-at_install')
+class TestMeterQuotationCountSearch(SparksDatasetCase):
+    """Searches on the number of quotations of the meters"""
+
+    METER_COUNT = 6
+    METERS_PER_PARTNER = 3
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        Meter = cls.env['sparks.energy.meter']
+        cls.no_quotation = Meter.create({
+            'name': 'COUNT-0',
+            'supply_number': 'SN-COUNT-0',
+            'partner_id': cls.partners[0].id,
+        })
+        cls.one_quotation, cls.two_quotations = cls.meters[:2]
+        cls.quotations[0].meter_ids = [(4, cls.two_quotations.id)]  # Also in quotations[1]
+        cls.scope = cls.no_quotation | cls.one_quotation | cls.two_quotations
+
+    def test_search(self):
+        Meter = self.env['sparks.energy.meter']
+        cases = [
+            ('=', 0, self.no_quotation),
+            ('=', 1, self.one_quotation),
+            ('!=', 0, self.one_quotation | self.two_quotations),
+            ('!=', 1, self.no_quotation | self.two_quotations),
+            ('>', 0, self.one_quotation | self.two_quotations),
+            ('>', 1, self.two_quotations),
+            ('>=', 1, self.one_quotation | self.two_quotations),
+            ('<', 1, self.no_quotation),
+            ('<', 2, self.no_quotation | self.one_quotation),
+            ('<=', 0, self.no_quotation),
+        ]
+        for operator, value, expected in cases:
+            with self.subTest(operator=operator, value=value):
+                scope = [('id', 'in', self.scope.ids)]
+                self.assertEqual(Meter.search(scope + [('quotation_count', operator, value)]), expected)
+
+
+@tagged('post_install', '-at_install')
+class TestMeterUniqueKey(TransactionCase):
+    """Messages of the set-wise supply number validation"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.partner = cls.env['res.partner'].create({'name': 'Unique Key Customer'})
+        cls.meter = cls.env['sparks.energy.meter'].create({
+            'name': 'UK-1',
+            'supply_number': 'SN-UK-1',
+            'partner_id': cls.partner.id,
+        })
+
+    def _meter_vals(self, name, supply_number):
+        return {'name': name, 'supply_number': supply_number, 'partner_id': self.partner.id}
+
+    def test_stored_duplicate(self):
+        message = "Supply number 'SN-UK-1' already exists for meter '%s'" % self.meter.display_name
+        with self.assertRaises(ValidationError) as error:
+            self.env['sparks.energy.meter'].create([self._meter_vals('UK-2', 'SN-UK-1')])
+        self.assertEqual(str(error.exception), message)
+
+        other = self.env['sparks.energy.meter'].create([self._meter_vals('UK-3', 'SN-UK-3')])
+        with self.assertRaises(ValidationError) as error:
+            other.supply_number = 'SN-UK-1'
+        self.assertEqual(str(error.exception), message)
+
+    def test_batch_duplicate(self):
+        with self.assertRaises(ValidationError) as error:
+            self.env['sparks.energy.meter'].create([
+                self._meter_vals('UK-4', 'SN-UK-4'),
+                self._meter_vals('UK-5', 'SN-UK-4'),
+            ])
+        self.assertEqual(
+            str(error.exception), "Supply number 'SN-UK-4' appears more than once in the imported batch")
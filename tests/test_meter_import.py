@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+import base64
+import io
+import zipfile
+
+from odoo.tests import tagged
+
+from .common import SparksDatasetCase
+
+
+@tagged('post_install', '-at_install')
+class TestMeterHistoryImport(SparksDatasetCase):
+    """Upsert of meter consumption history files"""
+
+    METER_COUNT = 6
+    METERS_PER_PARTNER = 3
+
+    def _history_csv(self, rows):
+        lines = ['supply_number,year,month,consumption,cost'] + ['%s,%s,%s,%s,%s' % row for row in rows]
+        return '\n'.join(lines).encode()
+
+    def _import(self, content, filename='history.csv', file_type='csv'):
+        wizard = self.env['sparks.import.meter.consumption.wizard'].create({
+            'import_file': base64.b64encode(content),
+            'filename': filename,
+            'file_type': file_type,
+        })
+        wizard.action_import()
+        return wizard
+
+    def _bill_count(self):
+        return self.env['sparks.meter.consumption'].search_count([('meter_id', 'in', self.meters.ids)])
+
+    def assertCounts(self, wizard, inserted, updated, unchanged):
+        self.assertEqual(
+            (wizard.inserted_count, wizard.updated_count, wizard.unchanged_count),
+            (inserted, updated, unchanged),
+        )
+
+    def test_import_twice(self):
+        meters = self.meters[:2]
+        last_year = self.current_year - 1
+        rows = [
+            (meter.supply_number, self.current_year, month, 300 + month, 36 + month)
+            for meter in meters for month in (1, 2, 3)
+        ]
+        # An existing bill of last year, with a new consumption
+        rows.append((meters[0].supply_number, last_year, 12, 999, 120))
+        content = self._history_csv(rows)
+        bill_count = self._bill_count()
+
+        self.assertCounts(self._import(content), inserted=6, updated=1, unchanged=0)
+        self.assertEqual(self._bill_count(), bill_count + 6)
+        bill = meters[0].consumption_line_ids.filtered(lambda b: b.year == last_year and b.month == '12')
+        self.assertEqual(bill.energy_kwh, 999)
+
+        self.assertCounts(self._import(content), inserted=0, updated=0, unchanged=7)
+        self.assertEqual(self._bill_count(), bill_count + 6)
+
+        rows[0] = rows[0][:3] + (450, rows[0][4])
+        self.assertCounts(self._import(self._history_csv(rows)), inserted=0, updated=1, unchanged=6)
+        self.assertEqual(self._bill_count(), bill_count + 6)
+        self.assertEqual(meters[0].consumption_bill_count, len(meters[0].consumption_line_ids))
+
+    def _history_zip(self, files):
+        stream = io.BytesIO()
+        with zipfile.ZipFile(stream, 'w') as archive:
+            for name, content in files.items():
+                archive.writestr(name, content)
+        return stream.getvalue()
+
+    def test_import_archive(self):
+        meter, other = self.meters[:2]
+        content = self._history_zip({
+            'a_meter.csv': self._history_csv([
+                (meter.supply_number, self.current_year, 1, 310, 37),
+                (meter.supply_number, self.current_year, 2, 320, 38),
+            ]),
+            'b_partial.csv': self._history_csv([
+                (other.supply_number, self.current_year, 1, 410, 49),
+                (other.supply_number, self.current_year, 'Foo', 420, 50),
+                ('SN-UNKNOWN', self.current_year, 3, 430, 51),
+            ]),
+            'c_broken.xlsx': b'PK\x03\x04 not a workbook',
+            'notes/readme.md': b'Ignored',
+            '__MACOSX/a_meter.csv': b'Ignored',
+        })
+        config = self.env['ir.config_parameter'].sudo()
+        for workers in ('1', '2'):
+            with self.subTest(workers=workers):
+                config.set_param('sparks.import_workers', workers)
+                wizard = self._import(content, filename='history.zip', file_type='zip')
+                self.assertEqual(wizard.file_report.splitlines(), [
+                    'a_meter.csv: 2 rows, 0 skipped',
+                    'b_partial.csv: 1 rows, 2 skipped',
+                    'c_broken.xlsx: failed, 1 errors',
+                ])
+                self.assertEqual(wizard.error_log.splitlines(), [
+                    'b_partial.csv: Row 3: Invalid month value: Foo',
+                    "b_partial.csv: Row 4: Unknown supply number 'SN-UNKNOWN'",
+                    'c_broken.xlsx: Cannot read file: Unsupported file format',
+                ])
+                self.assertEqual(wizard.skipped_count, 3)
+                self.assertEqual(wizard.inserted_count + wizard.unchanged_count, 3)
+        self.assertEqual(len(meter.consumption_line_ids.filtered(lambda b: b.year == self.current_year)), 2)
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+from datetime import date
+
+from odoo.tests import BaseCase, tagged
+
+from ..lib.month_parser import parse_month, parse_month_column, parse_month_year
+
+
+@tagged('post_install', '-at_install')
+class TestMonthParser(BaseCase):
+    """Month cells accepted by the imports"""
+
+    def test_accepted_forms(self):
+        cases = {
+            'Enero': ('1', None),
+            ' FEB ': ('2', None),
+            'abr.': ('4', None),
+            'sept': ('9', None),
+            7: ('7', None),
+            8.0: ('8', None),
+            '1.0': ('1', None),
+            '12.00': ('12', None),
+            '2024-05': ('5', 2024),
+            '06/2024': ('6', 2024),
+            '15/03/2024': ('3', 2024),
+            'marzo de 2024': ('3', 2024),
+            '202403': ('3', 2024),
+            202403.0: ('3', 2024),
+            'Mar-24': ('3', 2024),
+            'ene-24': ('1', 2024),
+            'dic. 23': ('12', 2023),
+            'set/24': ('9', 2024),
+            date(2023, 11, 5): ('11', 2023),
+        }
+        for value, expected in cases.items():
+            with self.subTest(value=value):
+                self.assertEqual(parse_month_year(value), expected)
+        self.assertEqual(parse_month_column(list(cases)), list(cases.values()))
+
+    def test_rejected_forms(self):
+        for value in ('Foo', '13', '13.0', '1.5', 0, True, '03-24', 'abc-24', None):
+            with self.subTest(value=value):
+                self.assertIsNone(parse_month_year(value))
+        with self.assertRaisesRegex(ValueError, 'Invalid month value: Foo'):
+            parse_month('Foo')
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import math
+import time
+from datetime import date
+
+from odoo.tests import BaseCase, tagged
+
+from ..lib import solar_kernel
+from ..lib.month_parser import parse_month_column, parse_month_year
+from .common import SparksDatasetCase
+
+_logger = logging.getLogger(__name__)
+
+# Maximum number of queries per operation. The budgets must not depend on
+# the dataset size: the larger datasets below run with the same numbers, so
+# anything issuing queries per record fails there first.
+QUERY_BUDGETS = {
+    'quotation_calculate': 60,
+    'meter_stats_recompute': 12,
+    'onchange_meter_ids': 12,
+    'search_quotation_count': 6,
+    'import_wizard': 45,
+    'partner_stats': 12,
+    'multi_meter_wizard': 80,
+    'sizing_options': 10,
+    'best_panels': 6,
+}
+
+# Maximum cost of the column-wise month parsing relative to parsing every
+# cell on its own, both timed in the same run (about 0.1 on a quiet machine)
+MONTH_PARSING_MAX_RATIO = 0.5
+
+
+@tagged('post_install', '-at_install', 'sparks_perf')
+class TestSparksPerformance(SparksDatasetCase):
+
+    def test_quotation_create_and_calculate(self):
+        meters = self._partner_meters(self.partners[0])
+        with self.assertBudget('quotation create + calculate', QUERY_BUDGETS['quotation_calculate']):
+            quotation = self.env['sparks.solar.quotation'].create({
+                'partner_id': meters.partner_id.id,
+                'city_id': self.city.id,
+                'selected_panel_id': self.panel.id,
+                'meter_ids': [(6, 0, meters.ids)],
+                'consumption_line_ids': self._consumption_line_commands(),
+            })
+            quotation.action_calculate_system()
+        self.assertEqual(quotation.state, 'calculated')
+        self.assertGreater(quotation.panel_quantity, 0)
+        self.assertGreater(quotation.total_investment, 0)
+        self.assertGreater(quotation.levelized_cost_of_energy, 0)
+        self.assertGreater(quotation.internal_rate_of_return, 0)
+        balance = quotation.monthly_balance
+        self.assertEqual(len(balance['production']), 12)
+        self.assertAlmostEqual(sum(balance['production']), quotation.estimated_annual_production, places=0)
+        self.assertAlmostEqual(
+            quotation.annual_self_consumption + quotation.annual_deficit,
+            quotation.total_annual_consumption, places=2)
+
+    def test_meter_stats_recompute(self):
+        with self.assertBudget('meter stats recompute', QUERY_BUDGETS['meter_stats_recompute'],
+                               record_count=len(self.meters)):
+            self._recompute_meter_stats(self.meters)
+        meter = self.meters[0]
+        self.assertEqual(meter.peak_monthly_consumption, max(meter.consumption_line_ids.mapped('energy_kwh')))
+
+    def test_onchange_meter_ids(self):
+        meters = self._partner_meters(self.partners[0])
+        with self.assertBudget('_onchange_meter_ids', QUERY_BUDGETS['onchange_meter_ids']):
+            quotation = self.env['sparks.solar.quotation'].new({
+                'partner_id': meters.partner_id.id,
+                'meter_ids': [(6, 0, meters.ids)],
+            })
+            quotation._onchange_meter_ids()
+        self.assertEqual(len(quotation.consumption_line_ids), 12)
+        expected = sum(
+            consumption.energy_kwh
+            for meter in meters
+            for consumption in meter.consumption_line_ids.sorted('year_month', reverse=True)[:12]
+        )
+        self.assertAlmostEqual(sum(quotation.consumption_line_ids.mapped('energy_kwh')), expected)
+
+    def test_search_quotation_count(self):
+        Meter = self.env['sparks.energy.meter']
+        with self.assertBudget('search quotation_count', QUERY_BUDGETS['search_quotation_count']):
+            meters = Meter.search([('quotation_count', '>=', 1)])
+        self.assertEqual(len(meters), len(self.meters))
+
+    def test_import_wizard(self):
+        quotation = self.quotations[0]
+        rows = [(month, 500 + month, 60 + month) for month in range(1, 13)]
+        with self.assertBudget('import wizard', QUERY_BUDGETS['import_wizard'], record_count=len(rows)):
+            wizard = self.env['sparks.import.consumption.wizard'].create({
+                'quotation_id': quotation.id,
+                'import_file': self._csv_file(rows),
+                'filename': 'bills.csv',
+                'file_type': 'csv',
+            })
+            wizard.action_import()
+        self.assertEqual(len(quotation.consumption_line_ids), 12)
+        self.assertEqual(quotation.total_annual_consumption, sum(row[1] for row in rows))
+
+    def test_sizing_options(self):
+        quotation = self.quotations[0]
+        with self.assertBudget('sizing options', QUERY_BUDGETS['sizing_options']):
+            options = quotation.get_sizing_options(min_coverage=50.0)
+        self.assertTrue(options)
+        self.assertTrue(all(option['coverage_percentage'] >= 50.0 for option in options))
+        costs = [option['total_investment'] for option in options]
+        self.assertEqual(costs, sorted(costs))
+        # Pareto front: a more expensive option covers more or takes less roof
+        for cheaper, dearer in zip(options, options[1:]):
+            self.assertTrue(
+                dearer['coverage_percentage'] > cheaper['coverage_percentage']
+                or dearer['total_panel_area_m2'] < cheaper['total_panel_area_m2'])
+
+    @staticmethod
+    def _panel_score(panel, power_kw):
+        """Score of a ``PanelSpec`` for a power, spelled out"""
+        quantity = math.ceil(power_kw * 1000 / panel.power_wp)
+        score = panel.efficiency * 2 + solar_kernel.TECH_BONUS.get(panel.technology, 0)
+        if panel.is_preferred:
+            score += 50
+        if panel.area_m2:
+            score += 1000 / (quantity * panel.area_m2)
+        if panel.unit_cost:
+            score += 10000 / (quantity * panel.unit_cost / (quantity * panel.power_wp / 1000))
+        return score
+
+    def test_best_panels_for_powers(self):
+        Panel = self.env['sparks.solar.panel.product']
+        powers = [0.5 * index for index in range(1, 201)]
+        with self.assertBudget('best panels', QUERY_BUDGETS['best_panels'], record_count=len(powers)):
+            results = Panel.get_best_panels_for_powers(powers, limit=3)
+        self.assertEqual(len(results), len(powers))
+        catalog = Panel._get_panel_catalog(self.env.company.id)
+        for power, top in zip(powers, results):
+            # First panel of the catalog with the highest score
+            _index, best = max(
+                enumerate(catalog), key=lambda item: (self._panel_score(item[1], power), -item[0]))
+            self.assertEqual(top[0]['panel'].id, best.id)
+            self.assertAlmostEqual(top[0]['score'], self._panel_score(best, power))
+            self.assertEqual(top[0]['panels_needed'], math.ceil(power * 1000 / best.power_wp))
+            self.assertEqual([entry['score'] for entry in top], sorted((entry['score'] for entry in top), reverse=True))
+
+    def test_multi_meter_wizard(self):
+        partner = self.partners[0]
+        meters = self._partner_meters(partner)
+        with self.assertBudget('multi-meter wizard', QUERY_BUDGETS['multi_meter_wizard'],
+                               record_count=len(meters)):
+            wizard = self.env['sparks.multi.meter.quotation.wizard'].new({
+                'partner_id': partner.id,
+                'location_strategy': 'meter',
+            })
+            wizard._onchange_meter_filters()
+            action = wizard.action_create_quotation()
+        self.assertEqual(len(wizard.meter_line_ids), len(meters))
+        self.assertEqual(len(wizard.preview_line_ids), 12)
+        quotations = self.env['sparks.solar.quotation'].search(action['domain'])
+        self.assertEqual(len(quotations), len(meters))
+        self.assertAlmostEqual(
+            sum(quotations.mapped('total_annual_consumption')),
+            sum(meters.mapped('last_12_months_consumption')),
+        )
+
+    def test_partner_stats(self):
+        fnames = [
+            'energy_meter_count', 'solar_quotation_count',
+            'total_monthly_consumption', 'total_installed_capacity',
+        ]
+        with self.assertBudget('partner stats', QUERY_BUDGETS['partner_stats'],
+                               record_count=len(self.partners)):
+            stats = self.partners.read(fnames)
+        self.assertEqual(sum(row['energy_meter_count'] for row in stats), len(self.meters))
+        self.assertEqual(sum(row['solar_quotation_count'] for row in stats), len(self.quotations))
+
+
+# Wall-clock timings: only run on demand, with --test-tags sparks_benchmark
+@tagged('post_install', '-at_install', '-standard', 'sparks_benchmark')
+class TestMonthParsingBenchmark(BaseCase):
+    """Per-row cost of the month column parsing used by the imports"""
+
+    CELLS = [
+        'Enero', 'febrero', 'MAR', 'abr.', '2024-05', '06/2024', 'julio 2024',
+        8, 9.0, 'Oct', 'nov', 'diciembre 2023', date(2024, 1, 1),
+    ]
+    ROW_COUNT = 100000
+
+    def test_month_column_parsing(self):
+        cells = self.CELLS * (self.ROW_COUNT // len(self.CELLS))
+        start = time.perf_counter()
+        months = parse_month_column(cells)
+        column_us = (time.perf_counter() - start) / len(cells) * 1e6
+
+        start = time.perf_counter()
+        expected = [parse_month_year(cell) for cell in cells]
+        cell_us = (time.perf_counter() - start) / len(cells) * 1e6
+
+        _logger.info(
+            "sparks perf month parsing [%d cells]: %.3f us/row column-wise, %.3f us/row per cell",
+            len(cells), column_us, cell_us,
+        )
+        self.assertEqual(months, expected)
+        self.assertEqual(months[:3], [('1', None), ('2', None), ('3', None)])
+        self.assertEqual(months[4:7], [('5', 2024), ('6', 2024), ('7', 2024)])
+        self.assertLess(column_us, cell_us * MONTH_PARSING_MAX_RATIO)
+
+
+@tagged('post_install', '-at_install', '-standard', 'sparks_perf_large')
+class TestSparksPerformance10k(TestSparksPerformance):
+    METER_COUNT = 10000
+
+
+@tagged('post_install', '-at_install', '-standard', 'sparks_perf_large')
+class TestSparksPerformance100k(TestSparksPerformance):
+    METER_COUNT = 100000
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+from unittest.mock import patch
+
+from odoo.tests import new_test_user, tagged
+
+from ..models import solar_quotation
+from .common import SparksDatasetCase
+
+# Value written over the stored investments: repriced quotations lose it
+TAMPERED_INVESTMENT = 1.0
+
+
+@tagged('post_install', '-at_install')
+class TestPricingPropagation(SparksDatasetCase):
+    """Open quotations repriced by kit cost and energy price changes"""
+
+    METER_COUNT = 6
+    METERS_PER_PARTNER = 3
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reference = cls.env['sparks.solar.kit.reference'].search([('name', '=', 'Benchmark costs')])
+        # Priced with the 5 kW tier, one quotation per state
+        cls.small = cls._create_sized_quotations(4.0, ['draft', 'calculated', 'sent', 'confirmed', 'cancelled'])
+        # Priced with the 20 kW tier
+        cls.large = cls._create_sized_quotations(15.0, ['draft'])
+        cls.all_quotations = cls.quotations | cls.small | cls.large
+
+    @classmethod
+    def _create_sized_quotations(cls, power_kw, states):
+        """One quotation of about ``power_kw`` for each of ``states``"""
+        radiation = cls.env['sparks.solar.radiation']._get_annual_radiation(cls.city.id)
+        monthly_kwh = power_kw * radiation * 0.85 / 12
+        quotations = cls.env['sparks.solar.quotation'].create([{
+            'partner_id': cls.partners[0].id,
+            'city_id': cls.city.id,
+            'selected_panel_id': cls.panel.id,
+            'consumption_line_ids': [(0, 0, {
+                'month': str(month),
+                'energy_kwh': monthly_kwh,
+            }) for month in range(1, 13)],
+        } for _state in states])
+        for quotation, state in zip(quotations, states):
+            quotation.state = state
+        return quotations
+
+    def _tamper_investments(self):
+        self.env.flush_all()
+        self.env.cr.execute(
+            "UPDATE sparks_solar_quotation SET total_investment = %s WHERE id = ANY(%s)",
+            [TAMPERED_INVESTMENT, self.all_quotations.ids],
+        )
+        self.all_quotations.invalidate_recordset(['total_investment'])
+
+    def _repriced(self):
+        return self.all_quotations.filtered(lambda quotation: quotation.total_investment != TAMPERED_INVESTMENT)
+
+    def _kit_detail(self, reference, power):
+        return reference.detail_line_ids.filtered(lambda detail: detail.power_capacity_id.power == power)
+
+    def test_kit_cost_change_reprices_open_quotations_of_the_tier(self):
+        self.assertEqual(set(self.small.mapped('actual_system_power_kw')), {4.4})
+        self._tamper_investments()
+        detail = self._kit_detail(self.reference, 5)
+        detail.equipment_cost += 500.0
+
+        self.assertEqual(self._repriced(), self.small[:2])
+        for quotation in self.small[:2]:
+            self.assertAlmostEqual(
+                quotation.total_investment,
+                quotation.actual_system_power_kw * detail.cost_per_kw * (1 + quotation.tax_rate / 100.0),
+            )
+
+    def test_energy_price_change_reprices_every_open_quotation(self):
+        self._tamper_investments()
+        projection = self.projection.filtered(lambda p: p.name == str(self.current_year))
+        projection.projected_price = 0.2
+
+        self.assertEqual(self._repriced(), self.quotations | self.small[:2] | self.large)
+
+    def test_reference_not_in_force_reprices_nothing(self):
+        later_year = self.projection.filtered(lambda p: p.name == str(self.current_year + 5))
+        later_reference = self.reference.copy({'name': 'Later costs', 'year': later_year.id})
+        later_reference.detail_line_ids = [(0, 0, {
+            'power_capacity_id': detail.power_capacity_id.id,
+            'equipment_cost': detail.equipment_cost,
+        }) for detail in self.reference.detail_line_ids]
+        self._tamper_investments()
+        self._kit_detail(later_reference, 5).equipment_cost += 500.0
+
+        self.assertFalse(self._repriced())
+
+    def test_repricing_job_matches_immediate_repricing(self):
+        self.patch(self.env.cr, 'commit', lambda: None)  # The job runner commits
+        self._tamper_investments()
+        self.env.cr.execute(
+            "UPDATE sparks_solar_quotation SET panel_quantity = 1 WHERE id = ANY(%s)", [self.all_quotations.ids])
+        self.all_quotations.invalidate_recordset(['panel_quantity'])
+        detail = self._kit_detail(self.reference, 5)
+        with patch.object(solar_quotation, 'REPRICING_JOB_THRESHOLD', 0):
+            detail.equipment_cost += 500.0
+        job = self.env['sparks.recompute.job'].search([], limit=1)
+        self.assertEqual(job.method_name, '_recompute_financial_data')
+        self.env['sparks.recompute.job']._cron_process_jobs()
+
+        self.assertEqual(job.state, 'done')
+        self.assertEqual(self._repriced(), self.small[:2])
+        for quotation in self.small[:2]:
+            self.assertAlmostEqual(
+                quotation.total_investment,
+                quotation.actual_system_power_kw * detail.cost_per_kw * (1 + quotation.tax_rate / 100.0),
+            )
+        # Repricing only: the systems are not sized again
+        self.assertEqual(set(self.all_quotations.mapped('panel_quantity')), {1})
+
+    def test_kit_cost_interpolation_parameter(self):
+        Quotation = self.env['sparks.solar.quotation']
+        config = self.env['ir.config_parameter'].sudo()
+        self.assertFalse(Quotation._use_kit_cost_interpolation())
+        for value, expected in (('True', True), ('1', True), ('False', False), ('0', False), ('off', False)):
+            with self.subTest(value=value):
+                config.set_param('sparks.kit_cost_interpolation', value)
+                self.assertIs(Quotation._use_kit_cost_interpolation(), expected)
+
+    def test_user_edit_enqueues_repricing_job(self):
+        user = new_test_user(self.env, login='sparks_pricing_user', groups='base.group_user')
+        detail = self._kit_detail(self.reference, 5).with_user(user)
+        with patch.object(solar_quotation, 'REPRICING_JOB_THRESHOLD', 0):
+            detail.equipment_cost += 500.0
+
+        job = self.env['sparks.recompute.job'].search([], limit=1)
+        self.assertEqual(job.model_name, 'sparks.solar.quotation')
+        self.assertEqual(job.total_records, 2)
+        self.assertEqual(job.create_uid, user)
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests import tagged
+
+from .common import SparksDatasetCase
+
+
+@tagged('post_install', '-at_install')
+class TestQuotationEngine(SparksDatasetCase):
+    """What-if simulations and stored quotations share their formulas"""
+
+    METER_COUNT = 6
+    METERS_PER_PARTNER = 3
+
+    def test_simulation_matches_the_quotation(self):
+        quotation = self.quotations[0]
+        simulated = self.env['sparks.solar.quotation'].simulate_quotation(
+            quotation.total_annual_consumption,
+            city_id=quotation.city_id.id,
+            panel_id=quotation.selected_panel_id.id,
+            system_efficiency=quotation.system_efficiency,
+            tax_rate=quotation.tax_rate,
+        )
+        self.assertGreater(simulated['total_investment'], 0)
+        for name, value in simulated.items():
+            with self.subTest(field=name):
+                self.assertAlmostEqual(quotation[name], value, places=6)
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests import tagged
+
+from .common import SparksDatasetCase
+
+
+@tagged('post_install', '-at_install')
+class TestRecomputeJob(SparksDatasetCase):
+    """Background recomputation of a selection of records"""
+
+    METER_COUNT = 6
+    METERS_PER_PARTNER = 3
+
+    def setUp(self):
+        super().setUp()
+        # The runner commits after each chunk
+        self.patch(self.env.cr, 'commit', lambda: None)
+
+    def _tamper_peaks(self, meters):
+        self.env.flush_all()
+        self.env.cr.execute(
+            "UPDATE sparks_energy_meter SET peak_monthly_consumption = 1 WHERE id = ANY(%s)", [meters.ids])
+        meters.invalidate_recordset(['peak_monthly_consumption'])
+
+    def test_sparse_selection(self):
+        meters = self.meters.sorted('id')
+        selected = meters[0] | meters[2] | meters[5]
+        self._tamper_peaks(meters)
+
+        job = self.env['sparks.recompute.job']._enqueue(selected, chunk_size=2)
+        self.assertEqual(job.chunk_ids.mapped('record_ids'), [[meters[0].id, meters[2].id], [meters[5].id]])
+        self.env['sparks.recompute.job']._cron_process_jobs()
+
+        self.assertEqual(job.state, 'done')
+        self.assertEqual(job.chunk_ids.mapped('record_count'), [2, 1])
+        self.assertEqual((job.total_records, job.processed_records, job.progress), (3, 3, 100.0))
+        recomputed = meters.filtered(lambda meter: meter.peak_monthly_consumption != 1)
+        self.assertEqual(recomputed, selected)
+        for meter in selected:
+            self.assertEqual(meter.peak_monthly_consumption, max(meter.consumption_line_ids.mapped('energy_kwh')))
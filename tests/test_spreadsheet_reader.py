@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+import io
+
+from odoo.tests import BaseCase, tagged
+
+from ..lib import spreadsheet_reader
+
+
+@tagged('post_install', '-at_install')
+class TestSpreadsheetReader(BaseCase):
+    """Decoding of text exports"""
+
+    def test_late_latin1_byte(self):
+        # UTF-8 over the whole detection head, a Latin-1 byte much later
+        lines = ['month,consumption,cost'] + ['Ene,%d,%d' % (100 + n, 12) for n in range(1000)]
+        content = '\n'.join(lines).encode() + '\nDic,150,18,Guayaquil Año\n'.encode('latin-1')
+        self.assertGreater(len(content), spreadsheet_reader.HEAD_SIZE * 2)
+
+        rows = list(spreadsheet_reader.iter_rows(io.BytesIO(content)))
+        self.assertEqual(len(rows), 1002)
+        self.assertEqual(rows[-1], ('Dic', 150, 18, 'Guayaquil Año'))
+
+    def test_utf8_and_latin1_files(self):
+        for encoding in ('utf-8', 'latin-1'):
+            with self.subTest(encoding=encoding):
+                content = 'month,consumption\nEnero,120\nDiciembre,130,Año\n'.encode(encoding)
+                rows = list(spreadsheet_reader.iter_rows(io.BytesIO(content)))
+                self.assertEqual(rows[-1], ('Diciembre', 130, 'Año'))
@@ -1,3 +1,5 @@
 # -*- coding: utf-8 -*-
+from . import import_file_mixin
 from . import import_consumption_wizard
+from . import import_meter_consumption_wizard
 from . import multi_meter_quotation_wizard# -*- coding: utf-8 -*-
\ No newline at end of file
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import base64
+import hashlib
+import io
+from odoo import models, fields, _
+from odoo.exceptions import UserError
+from ..lib import spreadsheet_reader
+
+
+class ImportFileMixin(models.AbstractModel):
+    _name = 'sparks.import.file.mixin'
+    _description = 'Spreadsheet Upload for Import Wizards'
+
+    import_file = fields.Binary(
+        string='Import File',
+        required=True,
+        help="Excel (.xlsx/.xls) or CSV file to import"
+    )
+    
+    filename = fields.Char(string='Filename')
+    
+    file_type = fields.Selection([
+        ('excel', 'Excel File (.xlsx/.xls)'),
+        ('csv', 'CSV File (.csv)')
+    ], string='File Type', default='excel')
+    
+    has_header = fields.Boolean(
+        string='File has header row',
+        default=True,
+        help="Check if the first row contains column headers"
+    )
+
+    def _detect_file_type(self):
+        """Set the file type from the uploaded file name"""
+        if self.filename:
+            if self.filename.lower().endswith(('.xlsx', '.xls')):
+                self.file_type = 'excel'
+            elif self.filename.lower().endswith('.csv'):
+                self.file_type = 'csv'
+
+    def _get_import_attachments(self):
+        return self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name),
+            ('res_field', '=', 'import_file'),
+            ('res_id', 'in', self.ids),
+        ])
+
+    def _get_file_checksum(self):
+        """SHA-1 of the uploaded content, as stored by ir.attachment"""
+        attachment = self._get_import_attachments()[:1] if self.id else None
+        if attachment and attachment.checksum:
+            return attachment.checksum
+        return hashlib.sha1(base64.b64decode(self.import_file)).hexdigest()
+
+    def _open_import_file(self):
+        """Open the uploaded file as a binary stream
+
+        Saved wizards read the attachment from the filestore; during
+        onchanges the upload only exists in memory and is decoded there.
+        """
+        if self.id:
+            attachment = self._get_import_attachments()[:1]
+            if attachment.store_fname:
+                return open(attachment._full_path(attachment.store_fname), 'rb')
+        return io.BytesIO(base64.b64decode(self.import_file))
+
+    def _iter_rows(self, text_columns=()):
+        """Yield (row number, typed row) of the uploaded file one at a time
+
+        The format is detected from the file content, the file type only
+        being a hint shown to the user.
+        """
+        with self._open_import_file() as stream:
+            try:
+                yield from enumerate(spreadsheet_reader.iter_rows(stream, text_columns=text_columns), 1)
+            except ImportError as e:
+                raise UserError(_("Please install the library needed to import this file: %s") % e)
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import odoo.addons
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from ..lib import meter_history
+
+MAX_LOGGED_ERRORS = 100
+
+# Run first by each import worker: a fresh interpreter only finds the
+# modules of this addon once it has the addons paths of the server
+WORKER_BOOTSTRAP = "import odoo.addons; odoo.addons.__path__[:] = %r"
+
+
+class ImportMeterConsumptionWizard(models.TransientModel):
+    _name = 'sparks.import.meter.consumption.wizard'
+    _inherit = ['sparks.import.file.mixin']
+    _description = 'Import Meter Consumption History Wizard'
+
+    meter_id = fields.Many2one(
+        'sparks.energy.meter',
+        string='Energy Meter',
+        help="Meter receiving the rows without a supply number"
+    )
+
+    default_year = fields.Integer(
+        string='Year',
+        default=lambda self: fields.Date.today().year,
+        help="Year of the rows when the file has no year column"
+    )
+
+    # Column mapping (1-based, 0 when the file has no such column)
+    supply_number_column = fields.Integer(
+        string='Supply Number Column',
+        default=1,
+        help="Column number for the meter supply number (0 to import into the selected meter)"
+    )
+
+    year_column = fields.Integer(
+        string='Year Column',
+        default=2,
+        help="Column number for the year (0 to use the year above)"
+    )
+
+    month_column = fields.Integer(
+        string='Month Column',
+        default=3,
+        help="Column number for month data, a month number, name or date"
+    )
+
+    consumption_column = fields.Integer(
+        string='Consumption Column',
+        default=4,
+        help="Column number for consumption data (kWh)"
+    )
+
+    cost_column = fields.Integer(
+        string='Cost Column',
+        default=5,
+        help="Column number for cost data (0 if not present)"
+    )
+
+    demand_column = fields.Integer(
+        string='Max Demand Column',
+        default=0,
+        help="Column number for the maximum demand in kW (0 if not present)"
+    )
+
+    peak_column = fields.Integer(
+        string='Peak Hours Column',
+        default=0,
+        help="Column number for peak hours consumption in kWh (0 if not present)"
+    )
+
+    off_peak_column = fields.Integer(
+        string='Off-Peak Hours Column',
+        default=0,
+        help="Column number for off-peak hours consumption in kWh (0 if not present)"
+    )
+
+    file_type = fields.Selection(
+        selection_add=[('zip', 'ZIP Archive of CSV/Excel files (.zip)')],
+        ondelete={'zip': 'set default'}
+    )
+
+    # Results
+    inserted_count = fields.Integer(string='Inserted', readonly=True)
+    updated_count = fields.Integer(string='Updated', readonly=True)
+    unchanged_count = fields.Integer(string='Unchanged', readonly=True)
+    skipped_count = fields.Integer(string='Skipped', readonly=True)
+    error_log = fields.Text(string='Skipped Rows', readonly=True)
+    file_report = fields.Text(string='Files', readonly=True)
+
+    state = fields.Selection([
+        ('upload', 'Upload File'),
+        ('done', 'Import Complete')
+    ], default='upload')
+
+    @api.onchange('import_file', 'filename')
+    def _onchange_import_file(self):
+        if self.import_file and self.filename:
+            if self.filename.lower().endswith('.zip'):
+                self.file_type = 'zip'
+            else:
+                self._detect_file_type()
+
+    @api.onchange('meter_id')
+    def _onchange_meter_id(self):
+        # A single meter export usually has no supply number column
+        if self.meter_id and self.supply_number_column == 1:
+            self.supply_number_column = 0
+
+    def _get_parse_options(self):
+        return {
+            'columns': {
+                'supply_number': self.supply_number_column,
+                'year': self.year_column,
+                'month': self.month_column,
+                'consumption': self.consumption_column,
+                'cost': self.cost_column,
+                'demand': self.demand_column,
+                'peak': self.peak_column,
+                'off_peak': self.off_peak_column,
+            },
+            'has_header': self.has_header,
+            'default_year': self.default_year,
+        }
+
+    def _get_import_workers(self):
+        """Number of processes parsing the files of an archive"""
+        workers = self.env['ir.config_parameter'].sudo().get_param('sparks.import_workers')
+        return int(workers) if workers else min(4, os.cpu_count() or 1)
+
+    def _read_file_rows(self):
+        """Parse the upload, returning (name, parsed rows, errors) per file"""
+        options = self._get_parse_options()
+        with self._open_import_file() as stream:
+            if self.file_type == 'zip':
+                return self._read_archive_rows(stream, options)
+            try:
+                return [(self.filename or '', *meter_history.read_file(stream, options))]
+            except ImportError as e:
+                raise UserError(_("Please install the library needed to import this file: %s") % e)
+            except ValueError as e:
+                raise UserError(_("Cannot read file: %s") % e)
+
+    def _read_archive_rows(self, stream, options):
+        """Parse the spreadsheets of a ZIP archive in a process pool
+
+        Parsing is CPU bound, so files are spread over worker processes.
+        Workers are spawned as fresh interpreters rather than forked: a
+        fork of a server worker would inherit its database connections,
+        signal handlers and the locks held by its other threads.  They
+        only get the file contents.  At most two files per worker are in
+        flight to bound the memory held by pending contents.
+        """
+        try:
+            archive = zipfile.ZipFile(stream)
+        except zipfile.BadZipFile:
+            raise UserError(_("The file is not a valid ZIP archive"))
+
+        with archive:
+            members = [
+                info for info in archive.infolist()
+                if not info.is_dir() and not info.filename.startswith('__MACOSX/')
+                and info.filename.lower().endswith(meter_history.FILE_EXTENSIONS)
+            ]
+            tasks = ((info.filename, archive.read(info), options) for info in members)
+            workers = min(self._get_import_workers(), len(members))
+            if workers <= 1:
+                results = [meter_history.parse_file(task) for task in tasks]
+            else:
+                results = []
+                with ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=exec,
+                    initargs=(WORKER_BOOTSTRAP % list(odoo.addons.__path__),),
+                ) as pool:
+                    pending = set()
+                    for task in tasks:
+                        if len(pending) >= 2 * workers:
+                            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            results.extend(future.result() for future in done)
+                        pending.add(pool.submit(meter_history.parse_file, task))
+                    results.extend(future.result() for future in wait(pending)[0])
+
+        if not results:
+            raise UserError(_("The archive contains no CSV or Excel file"))
+        return sorted(results, key=lambda result: result[0])
+
+    def _format_row_error(self, row_idx, kind, value):
+        messages = {
+            'month': _("Invalid month value: %s"),
+            'year': _("Invalid year: %s"),
+            'consumption': _("Invalid consumption: %s"),
+            'negative': _("Energy consumption cannot be negative: %s"),
+            'value': _("Invalid value: %s"),
+            'supply_number': _("Unknown supply number '%s'"),
+            'file': _("Cannot read file: %s"),
+        }
+        if kind == 'meter':
+            message = _("Missing supply number")
+        else:
+            message = messages[kind] % (value if value is not None else '')
+        return _("Row %d: %s") % (row_idx, message) if row_idx else message
+
+    def _resolve_meters(self, rows, errors):
+        """Replace supply numbers by meter ids with one search for all files
+
+        Rows whose meter cannot be found are moved to ``errors``.
+        """
+        supply_numbers = {values['supply_number'] for row_idx, values in rows if values['supply_number']}
+        meters = self.env['sparks.energy.meter'].search_fetch(
+            [('supply_number', 'in', list(supply_numbers))], ['supply_number'],
+        ) if supply_numbers else self.env['sparks.energy.meter']
+        meter_ids = {meter.supply_number: meter.id for meter in meters}
+
+        resolved = []
+        for row_idx, values in rows:
+            supply_number = values.pop('supply_number')
+            if supply_number:
+                meter_id = meter_ids.get(supply_number)
+                if not meter_id:
+                    errors.append((row_idx, 'supply_number', supply_number))
+                    continue
+            elif self.meter_id:
+                meter_id = self.meter_id.id
+            else:
+                errors.append((row_idx, 'meter', ''))
+                continue
+            values['meter_id'] = meter_id
+            resolved.append(values)
+        return resolved
+
+    def action_import(self):
+        """Upsert the consumption history of every meter in the file or archive"""
+        self.ensure_one()
+        if not self.import_file:
+            raise UserError(_("Please select a file to import"))
+
+        is_archive = self.file_type == 'zip'
+        rows = []
+        error_lines = []
+        report_lines = []
+        for name, parsed, errors in self._read_file_rows():
+            parsed = self._resolve_meters(parsed, errors)
+            rows.extend(parsed)
+            messages = [self._format_row_error(*error) for error in sorted(errors, key=lambda error: error[0])]
+            if is_archive:
+                messages = ['%s: %s' % (name, message) for message in messages]
+                if errors and not parsed:
+                    report_lines.append(_("%s: failed, %d errors") % (name, len(errors)))
+                else:
+                    report_lines.append(_("%s: %d rows, %d skipped") % (name, len(parsed), len(errors)))
+            error_lines.extend(messages)
+
+        if not rows and error_lines:
+            raise UserError(_("No valid rows to import:\n%s") % '\n'.join(error_lines[:MAX_LOGGED_ERRORS]))
+
+        # A single batched write for all the files
+        inserted, updated, unchanged = self.env['sparks.meter.consumption']._upsert_consumption(rows)
+
+        error_log = '\n'.join(error_lines[:MAX_LOGGED_ERRORS])
+        if len(error_lines) > MAX_LOGGED_ERRORS:
+            error_log += '\n' + _("... and %d more") % (len(error_lines) - MAX_LOGGED_ERRORS)
+        self.write({
+            'state': 'done',
+            'inserted_count': inserted,
+            'updated_count': updated,
+            'unchanged_count': unchanged,
+            'skipped_count': len(error_lines),
+            'error_log': error_log,
+            'file_report': '\n'.join(report_lines),
+        })
+
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+            'context': self.env.context,
+        }
@@ -1,175 +1,173 @@
 # -*- coding: utf-8 -*-
 
-import base64
-import io
 from odoo import models, fields, api, _
-from odoo.exceptions import UserError, ValidationError
+from odoo.exceptions import UserError
+from ..lib import quotation_engine
 
-try:
-    import xlrd
-    import openpyxl
-except ImportError:
-    xlrd = None
-    openpyxl = None
+# Meters named in the breakdown of a preview month
+BREAKDOWN_METERS = 3
 
 
-class ImportConsumptionWizard(models.TransientModel):
-    _name = 'sparks.import.consumption.wizard'
-    _description = 'Import Monthly Consumption Data Wizard'
+class MultiMeterQuotationWizard(models.TransientModel):
+    _name = 'sparks.multi.meter.quotation.wizard'
+    _description = 'Create Quotations from Multiple Meters'
 
-    quotation_id = fields.Many2one(
-        'sparks.solar.quotation',
-        string='Solar Quotation',
+    partner_id = fields.Many2one(
+        'res.partner',
+        string='Customer',
         required=True
     )
-    
-    import_file = fields.Binary(
-        string='Import File',
-        required=True,
-        help="Excel file (.xlsx or .xls) with monthly consumption data"
+
+    # Meter filters
+    city_filter_id = fields.Many2one(
+        'sparks.solar.radiation',
+        string='Filter by City',
+        help="Only list the meters installed in this city"
     )
-    
-    filename = fields.Char(string='Filename')
-    
-    file_type = fields.Selection([
-        ('excel', 'Excel File (.xlsx/.xls)'),
-        ('csv', 'CSV File (.csv)')
-    ], string='File Type', default='excel')
-    
-    has_header = fields.Boolean(
-        string='File has header row',
-        default=True,
-        help="Check if the first row contains column headers"
+    meter_type_filter = fields.Selection([
+        ('residential', 'Residential'),
+        ('commercial', 'Commercial'),
+        ('industrial', 'Industrial')
+    ], string='Filter by Meter Type')
+
+    meter_line_ids = fields.One2many(
+        'sparks.multi.meter.quotation.wizard.line',
+        'wizard_id',
+        string='Meters'
     )
-    
-    month_column = fields.Integer(
-        string='Month Column',
-        default=1,
-        help="Column number for month data (1-based)"
+    meter_ids = fields.Many2many(
+        'sparks.energy.meter',
+        string='Selected Meters',
+        compute='_compute_meter_ids'
     )
-    
-    consumption_column = fields.Integer(
-        string='Consumption Column',
-        default=2,
-        help="Column number for consumption data (1-based)"
+    meter_count = fields.Integer(
+        string='Number of Meters',
+        compute='_compute_meter_ids'
     )
-    
-    cost_column = fields.Integer(
-        string='Cost Column',
-        default=3,
-        help="Column number for cost data (1-based, optional)"
+
+    location_strategy = fields.Selection([
+        ('single', 'One quotation for all meters'),
+        ('city', 'One quotation per city'),
+        ('meter', 'One quotation per meter'),
+    ], string='Quotations', default='single', required=True,
+        help="How the selected meters are grouped into quotations")
+
+    city_id = fields.Many2one(
+        'sparks.solar.radiation',
+        string='City',
+        help="City of the quotations, and of the meters without city when grouping by city"
+    )
+    installation_address = fields.Text(string='Installation Address')
+
+    total_annual_consumption = fields.Float(
+        string='Annual Consumption (kWh)',
+        compute='_compute_totals'
     )
-    
-    preview_data = fields.Text(
-        string='Preview',
-        readonly=True,
-        help="Preview of the data to be imported"
+    estimated_system_size = fields.Float(
+        string='Estimated System Size (kW)',
+        compute='_compute_totals'
     )
-    
-    state = fields.Selection([
-        ('upload', 'Upload File'),
-        ('preview', 'Preview Data'),
-        ('done', 'Import Complete')
-    ], default='upload')
-
-    @api.onchange('import_file', 'filename')
-    def _onchange_import_file(self):
-        if self.import_file and self.filename:
-            # Auto-detect file type
-            if self.filename.lower().endswith(('.xlsx', '.xls')):
-                self.file_type = 'excel'
-            elif self.filename.lower().endswith('.csv'):
-                self.file_type = 'csv'
-            
-            # Generate preview
-            self._generate_preview()
-
-    def _generate_preview(self):
-        """Generate a preview of the imported data"""
-        if not self.import_file:
-            return
-        
-        try:
-            file_data = base64.b64decode(self.import_file)
-            
-            if self.file_type == 'excel':
-                preview = self._preview_excel_data(file_data)
-            else:
-                preview = self._preview_csv_data(file_data)
-            
-            self.preview_data = preview
-            
-        except Exception as e:
-            self.preview_data = f"Error reading file: {str(e)}"
-
-    def _preview_excel_data(self, file_data):
-        """Preview Excel file data"""
-        if not openpyxl:
-            raise UserError(_("Please install openpyxl library to import Excel files"))
-        
-        try:
-            # Try openpyxl first (for .xlsx)
-            workbook = openpyxl.load_workbook(io.BytesIO(file_data))
-            sheet = workbook.active
-            
-            preview_lines = []
-            max_rows = 10  # Limit preview to 10 rows
-            
-            for row_idx, row in enumerate(sheet.iter_rows(max_row=max_rows, values_only=True), 1):
-                if row_idx == 1 and self.has_header:
-                    preview_lines.append(f"Header: {' | '.join(str(cell) for cell in row if cell is not None)}")
-                else:
-                    preview_lines.append(f"Row {row_idx}: {' | '.join(str(cell) for cell in row if cell is not None)}")
-            
-            return '\n'.join(preview_lines)
-            
-        except Exception:
-            # Fallback to xlrd for .xls files
-            if not xlrd:
-                raise UserError(_("Please install xlrd library to import .xls files"))
-            
-            workbook = xlrd.open_workbook(file_contents=file_data)
-            sheet = workbook.sheet_by_index(0)
-            
-            preview_lines = []
-            max_rows = min(10, sheet.nrows)
-            
-            for row_idx in range(max_rows):
-                row_data = [str(sheet.cell_value(row_idx, col_idx)) for col_idx in range(sheet.ncols)]
-                if row_idx == 0 and self.has_header:
-                    preview_lines.append(f"Header: {' | '.join(row_data)}")
-                else:
-                    preview_lines.append(f"Row {row_idx + 1}: {' | '.join(row_data)}")
-            
-            return '\n'.join(preview_lines)
-
-    def _preview_csv_data(self, file_data):
-        """Preview CSV file data"""
-        import csv
-        
-        # Decode file data
-        text_data = file_data.decode('utf-8-sig')
-        csv_reader = csv.reader(io.StringIO(text_data))
-        
+
+    preview_line_ids = fields.One2many(
+        'sparks.multi.meter.quotation.preview.line',
+        'wizard_id',
+        string='Consumption Preview'
+    )
+
+    @api.depends('meter_line_ids.selected')
+    def _compute_meter_ids(self):
+        for wizard in self:
+            wizard.meter_ids = wizard.meter_line_ids.filtered('selected').meter_id
+            wizard.meter_count = len(wizard.meter_ids)
+
+    @api.depends('meter_line_ids.selected', 'meter_line_ids.last_12_months_kwh', 'city_id')
+    def _compute_totals(self):
+        radiation = self.env['sparks.solar.radiation']
+        for wizard in self:
+            wizard.total_annual_consumption = sum(
+                wizard.meter_line_ids.filtered('selected').mapped('last_12_months_kwh'))
+            sizes = quotation_engine.size_systems(
+                [wizard.total_annual_consumption],
+                [radiation._get_annual_radiation(wizard.city_id._origin.id)],
+                [85.0], [0.0], [0.0],
+            )
+            wizard.estimated_system_size = float(sizes['system_power_kw'][0])
+
+    @api.onchange('partner_id', 'city_filter_id', 'meter_type_filter')
+    def _onchange_meter_filters(self):
+        """List the customer's meters matching the filters
+
+        Meters already listed keep their selection, new ones are selected.
+        """
+        selected = {line.meter_id._origin.id: line.selected for line in self.meter_line_ids}
+        meters = self._search_meters()
+        self.meter_line_ids = [(5, 0, 0)] + [
+            (0, 0, dict(values, selected=selected.get(values['meter_id'], True)))
+            for values in self._get_meter_line_values(meters)
+        ]
+        if not self.city_id:
+            self.city_id = self.city_filter_id or meters.city_id[:1]
+        self._update_preview()
+
+    @api.onchange('meter_line_ids')
+    def _onchange_meter_line_ids(self):
+        self._update_preview()
+
+    def _search_meters(self):
+        if not self.partner_id:
+            return self.env['sparks.energy.meter']
+        domain = [('partner_id', '=', self.partner_id._origin.id)]
+        if self.city_filter_id:
+            domain.append(('city_id', '=', self.city_filter_id._origin.id))
+        if self.meter_type_filter:
+            domain.append(('meter_type', '=', self.meter_type_filter))
+        return self.env['sparks.energy.meter'].search_fetch(
+            domain, ['name', 'city_id', 'meter_type', 'last_12_months_consumption'])
+
+    def _get_meter_line_values(self, meters):
+        """Lines of ``meters`` with their stored last 12 months consumption"""
+        return [{
+            'meter_id': meter.id,
+            'last_12_months_kwh': meter.last_12_months_consumption,
+        } for meter in meters]
+
+    def _get_selected_meters(self):
+        return self.meter_line_ids.filtered('selected').meter_id._origin
+
+    def _sum_monthly_consumption(self, meters, consumption):
+        """Monthly totals of ``meters`` as ``{month: (kWh, cost)}``"""
+        totals = {}
+        for meter in meters:
+            for month, (energy_kwh, energy_cost) in consumption.get(meter.id, {}).items():
+                kwh, cost = totals.get(month, (0.0, 0.0))
+                totals[month] = (kwh + energy_kwh, cost + energy_cost)
+        return totals
+
+    def _update_preview(self):
+        """Combined monthly consumption of the selected meters"""
+        meters = self._get_selected_meters()
+        consumption = meters._read_recent_consumption_by_month()
         preview_lines = []
-        max_rows = 10
-        
-        for row_idx, row in enumerate(csv_reader):
-            if row_idx >= max_rows:
-                break
-            
-            if row_idx == 0 and self.has_header:
-                preview_lines.append(f"Header: {' | '.join(row)}")
-            else:
-                preview_lines.append(f"Row {row_idx + 1}: {' | '.join(row)}")
-        
-        return '\n'.join(preview_lines)
-
-    def action_preview(self):
-        """Show preview of data to be imported"""
-        self._generate_preview()
-        self.state = 'preview'
-        
+        for month, (energy_kwh, energy_cost) in sorted(
+                self._sum_monthly_consumption(meters, consumption).items(), key=lambda item: int(item[0])):
+            contributions = sorted(
+                ((consumption[meter.id][month][0], meter.name) for meter in meters
+                 if month in consumption.get(meter.id, {})),
+                reverse=True,
+            )
+            breakdown = ', '.join(
+                '%s: %.0f kWh' % (name, kwh) for kwh, name in contributions[:BREAKDOWN_METERS])
+            if len(contributions) > BREAKDOWN_METERS:
+                breakdown += ', ' + _("+%d more") % (len(contributions) - BREAKDOWN_METERS)
+            preview_lines.append((0, 0, {
+                'month': month,
+                'energy_kwh': energy_kwh,
+                'energy_cost': energy_cost,
+                'meter_breakdown': breakdown,
+            }))
+        self.preview_line_ids = [(5, 0, 0)] + preview_lines
+
+    def _reopen(self):
         return {
             'type': 'ir.actions.act_window',
             'res_model': self._name,
@@ -179,196 +177,121 @@ class ImportConsumptionWizard(models.TransientModel):
             'context': self.env.context,
         }
 
-    def action_import(self):
-        """Import the consumption data"""
-        if not self.import_file:
-            raise UserError(_("Please select a file to import"))
-        
-        # Clear existing consumption lines
-        self.quotation_id.consumption_line_ids.unlink()
-        
-        try:
-            file_data = base64.b64decode(self.import_file)
-            
-            if self.file_type == 'excel':
-                consumption_data = self._import_excel_data(file_data)
-            else:
-                consumption_data = self._import_csv_data(file_data)
-            
-            # Create consumption lines
-            self._create_consumption_lines(consumption_data)
-            
-            self.state = 'done'
-            
-            return {
-                'type': 'ir.actions.client',
-                'tag': 'display_notification',
-                'params': {
-                    'title': _('Import Successful'),
-                    'message': _('%d consumption records imported successfully') % len(consumption_data),
-                    'type': 'success',
-                }
-            }
-            
-        except Exception as e:
-            raise UserError(_("Error importing file: %s") % str(e))
-
-    def _import_excel_data(self, file_data):
-        """Import data from Excel file"""
-        consumption_data = []
-        
-        try:
-            # Try openpyxl first
-            workbook = openpyxl.load_workbook(io.BytesIO(file_data))
-            sheet = workbook.active
-            
-            start_row = 2 if self.has_header else 1
-            
-            for row in sheet.iter_rows(min_row=start_row, values_only=True):
-                if not any(row):  # Skip empty rows
-                    continue
-                
-                try:
-                    month = self._parse_month(row[self.month_column - 1])
-                    consumption = float(row[self.consumption_column - 1] or 0)
-                    cost = float(row[self.cost_column - 1] or 0) if len(row) >= self.cost_column else 0
-                    
-                    consumption_data.append({
-                        'month': month,
-                        'energy_kwh': consumption,
-                        'energy_cost': cost
-                    })
-                    
-                except (ValueError, IndexError, TypeError):
-                    continue  # Skip invalid rows
-                    
-        except Exception:
-            # Fallback to xlrd
-            if not xlrd:
-                raise UserError(_("Please install xlrd library to import .xls files"))
-            
-            workbook = xlrd.open_workbook(file_contents=file_data)
-            sheet = workbook.sheet_by_index(0)
-            
-            start_row = 1 if self.has_header else 0
-            
-            for row_idx in range(start_row, sheet.nrows):
-                try:
-                    month = self._parse_month(sheet.cell_value(row_idx, self.month_column - 1))
-                    consumption = float(sheet.cell_value(row_idx, self.consumption_column - 1) or 0)
-                    cost = float(sheet.cell_value(row_idx, self.cost_column - 1) or 0) if sheet.ncols >= self.cost_column else 0
-                    
-                    consumption_data.append({
-                        'month': month,
-                        'energy_kwh': consumption,
-                        'energy_cost': cost
-                    })
-                    
-                except (ValueError, IndexError, TypeError):
-                    continue  # Skip invalid rows
-        
-        return consumption_data
-
-    def _import_csv_data(self, file_data):
-        """Import data from CSV file"""
-        import csv
-        consumption_data = []
-        
-        text_data = file_data.decode('utf-8-sig')
-        csv_reader = csv.reader(io.StringIO(text_data))
-        
-        # Skip header if present
-        if self.has_header:
-            next(csv_reader, None)
-        
-        for row in csv_reader:
-            if not any(row):  # Skip empty rows
-                continue
-            
-            try:
-                month = self._parse_month(row[self.month_column - 1])
-                consumption = float(row[self.consumption_column - 1] or 0)
-                cost = float(row[self.cost_column - 1] or 0) if len(row) >= self.cost_column else 0
-                
-                consumption_data.append({
+    def action_select_all(self):
+        self.ensure_one()
+        self.meter_line_ids.selected = True
+        self._update_preview()
+        return self._reopen()
+
+    def action_deselect_all(self):
+        self.ensure_one()
+        self.meter_line_ids.selected = False
+        self._update_preview()
+        return self._reopen()
+
+    def _group_meters(self, meters):
+        """Meters of each quotation to create, as a list of (city, meters)"""
+        if self.location_strategy == 'meter':
+            return [(meter.city_id or self.city_id, meter) for meter in meters]
+        if self.location_strategy == 'city':
+            groups = {}
+            for meter in meters:
+                city = meter.city_id or self.city_id
+                groups[city] = groups.get(city, meters.browse()) | meter
+            return list(groups.items())
+        return [(self.city_id, meters)]
+
+    def action_create_quotation(self):
+        """Create the quotations of the selected meters in a single batch"""
+        self.ensure_one()
+        meters = self._get_selected_meters()
+        if not meters:
+            raise UserError(_("Please select at least one meter"))
+
+        groups = self._group_meters(meters)
+        if any(not city for city, group in groups):
+            raise UserError(_("Please set a city for the quotations"))
+
+        consumption = meters._read_recent_consumption_by_month()
+        vals_list = []
+        for city, group in groups:
+            vals = {
+                'partner_id': self.partner_id.id,
+                'city_id': city.id,
+                'meter_ids': [(6, 0, group.ids)],
+                'consumption_line_ids': [(0, 0, {
                     'month': month,
-                    'energy_kwh': consumption,
-                    'energy_cost': cost
-                })
-                
-            except (ValueError, IndexError, TypeError):
-                continue  # Skip invalid rows
-        
-        return consumption_data
-
-    def _parse_month(self, month_value):
-        """Parse month value to standard format"""
-        if isinstance(month_value, (int, float)):
-            month_num = int(month_value)
-            if 1 <= month_num <= 12:
-                return str(month_num)
-        
-        if isinstance(month_value, str):
-            month_value = month_value.strip().lower()
-            
-            # Try to match month names
-            month_names = {
-                'january': '1', 'jan': '1', 'enero': '1',
-                'february': '2', 'feb': '2', 'febrero': '2',
-                'march': '3', 'mar': '3', 'marzo': '3',
-                'april': '4', 'apr': '4', 'abril': '4',
-                'may': '5', 'mayo': '5',
-                'june': '6', 'jun': '6', 'junio': '6',
-                'july': '7', 'jul': '7', 'julio': '7',
-                'august': '8', 'aug': '8', 'agosto': '8',
-                'september': '9', 'sep': '9', 'septiembre': '9',
-                'october': '10', 'oct': '10', 'octubre': '10',
-                'november': '11', 'nov': '11', 'noviembre': '11',
-                'december': '12', 'dec': '12', 'diciembre': '12'
+                    'energy_kwh': energy_kwh,
+                    'energy_cost': energy_cost,
+                }) for month, (energy_kwh, energy_cost) in sorted(
+                    self._sum_monthly_consumption(group, consumption).items(),
+                    key=lambda item: int(item[0]))],
             }
-            
-            for name, num in month_names.items():
-                if name in month_value:
-                    return num
-            
-            # Try to parse as number
-            try:
-                month_num = int(month_value)
-                if 1 <= month_num <= 12:
-                    return str(month_num)
-            except ValueError:
-                pass
-        
-        raise ValueError(f"Invalid month value: {month_value}")
-
-    def _create_consumption_lines(self, consumption_data):
-        """Create consumption lines from imported data"""
-        for data in consumption_data:
-            self.env['sparks.consumption.line'].create({
-                'quotation_id': self.quotation_id.id,
-                'month': data['month'],
-                'energy_kwh': data['energy_kwh'],
-                'energy_cost': data['energy_cost']
-            })
-
-    def action_back_to_upload(self):
-        """Go back to upload step"""
-        self.state = 'upload'
-        return {
-            'type': 'ir.actions.act_window',
-            'res_model': self._name,
-            'res_id': self.id,
-            'view_mode': 'form',
-            'target': 'new',
-            'context': self.env.context,
-        }
+            if self.installation_address:
+                vals['installation_address'] = self.installation_address
+            vals_list.append(vals)
+        quotations = self.env['sparks.solar.quotation'].create(vals_list)
 
-    def action_close(self):
-        """Close wizard and return to quotation"""
+        if len(quotations) == 1:
+            return {
+                'type': 'ir.actions.act_window',
+                'name': _('Solar Quotation'),
+                'res_model': 'sparks.solar.quotation',
+                'res_id': quotations.id,
+                'view_mode': 'form',
+                'target': 'current',
+            }
         return {
             'type': 'ir.actions.act_window',
+            'name': _('Solar Quotations'),
             'res_model': 'sparks.solar.quotation',
-            'res_id': self.quotation_id.id,
-            'view_mode': 'form',
+            'view_mode': 'list,form',
+            'domain': [('id', 'in', quotations.ids)],
             'target': 'current',
-        }
\ No newline at end of file
+        }
+
+
+class MultiMeterQuotationWizardLine(models.TransientModel):
+    _name = 'sparks.multi.meter.quotation.wizard.line'
+    _description = 'Meter of the Multi-Meter Quotation Wizard'
+
+    wizard_id = fields.Many2one(
+        'sparks.multi.meter.quotation.wizard',
+        required=True,
+        ondelete='cascade'
+    )
+    selected = fields.Boolean(string='Selected', default=True)
+    meter_id = fields.Many2one(
+        'sparks.energy.meter',
+        string='Meter',
+        required=True,
+        readonly=True
+    )
+    supply_number = fields.Char(related='meter_id.supply_number')
+    city_id = fields.Many2one(related='meter_id.city_id')
+    meter_type = fields.Selection(related='meter_id.meter_type')
+    last_12_months_kwh = fields.Float(
+        string='Last 12 Months (kWh)',
+        readonly=True
+    )
+
+
+class MultiMeterQuotationPreviewLine(models.TransientModel):
+    _name = 'sparks.multi.meter.quotation.preview.line'
+    _description = 'Combined Monthly Consumption Preview'
+    _order = 'id'
+
+    wizard_id = fields.Many2one(
+        'sparks.multi.meter.quotation.wizard',
+        required=True,
+        ondelete='cascade'
+    )
+    month = fields.Selection([
+        ('1', 'January'), ('2', 'February'), ('3', 'March'),
+        ('4', 'April'), ('5', 'May'), ('6', 'June'),
+        ('7', 'July'), ('8', 'August'), ('9', 'September'),
+        ('10', 'October'), ('11', 'November'), ('12', 'December'),
+    ], string='Month', readonly=True)
+    energy_kwh = fields.Float(string='Consumption (kWh)', readonly=True)
+    energy_cost = fields.Float(string='Cost', readonly=True)
+    meter_breakdown = fields.Char(string='Meters', readonly=True)